@@ -0,0 +1,42 @@
+"""add votes_count column to posts table
+
+Revision ID: 3c1f9b7d2e4a
+Revises: dff290560d68
+Create Date: 2026-10-18 15:31:07.204519
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "3c1f9b7d2e4a"
+down_revision = "dff290560d68"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        table_name="posts",
+        column=sa.Column(
+            "votes_count", sa.Integer(), nullable=False, server_default="0"
+        ),
+    )
+
+    # backfill from the votes that already exist
+    op.execute(
+        """
+        UPDATE posts
+        SET votes_count = counts.votes
+        FROM (
+            SELECT post_id, COUNT(*) AS votes FROM votes GROUP BY post_id
+        ) AS counts
+        WHERE posts.id = counts.post_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column(table_name="posts", column_name="votes_count")
@@ -0,0 +1,55 @@
+"""add trending_score column and ranking indexes to posts table
+
+Revision ID: 5d8a2f1c7b36
+Revises: b47d0e3a9c15
+Create Date: 2026-10-18 19:02:13.418275
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "5d8a2f1c7b36"
+down_revision = "b47d0e3a9c15"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        table_name="posts",
+        column=sa.Column(
+            "trending_score",
+            sa.Float(),
+            nullable=False,
+            server_default=sa.text("extract(epoch from now()) / 45000"),
+        ),
+    )
+
+    # backfill with the formula of `models.trending_score`
+    op.execute(
+        """
+        UPDATE posts
+        SET trending_score =
+            log(greatest(votes_count, 1)) + extract(epoch from created_at) / 45000
+        """
+    )
+
+    op.create_index(
+        index_name="ix_posts_votes_count_id",
+        table_name="posts",
+        columns=["votes_count", "id"],
+    )
+    op.create_index(
+        index_name="ix_posts_trending_score_id",
+        table_name="posts",
+        columns=["trending_score", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(index_name="ix_posts_trending_score_id", table_name="posts")
+    op.drop_index(index_name="ix_posts_votes_count_id", table_name="posts")
+    op.drop_column(table_name="posts", column_name="trending_score")
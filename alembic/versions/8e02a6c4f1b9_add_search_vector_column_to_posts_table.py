@@ -0,0 +1,44 @@
+"""add search_vector column to posts table
+
+Revision ID: 8e02a6c4f1b9
+Revises: 3c1f9b7d2e4a
+Create Date: 2026-10-18 15:52:19.730144
+
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "8e02a6c4f1b9"
+down_revision = "3c1f9b7d2e4a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        table_name="posts",
+        column=sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "setweight(to_tsvector('english', title), 'A') || "
+                "setweight(to_tsvector('english', content), 'B')",
+                persisted=True,
+            ),
+        ),
+    )
+    op.create_index(
+        index_name="ix_posts_search_vector",
+        table_name="posts",
+        columns=["search_vector"],
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(index_name="ix_posts_search_vector", table_name="posts")
+    op.drop_column(table_name="posts", column_name="search_vector")
@@ -0,0 +1,30 @@
+"""add token_version column to users table
+
+Revision ID: b47d0e3a9c15
+Revises: 8e02a6c4f1b9
+Create Date: 2026-10-18 16:34:51.096482
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "b47d0e3a9c15"
+down_revision = "8e02a6c4f1b9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        table_name="users",
+        column=sa.Column(
+            "token_version", sa.Integer(), nullable=False, server_default="0"
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column(table_name="users", column_name="token_version")
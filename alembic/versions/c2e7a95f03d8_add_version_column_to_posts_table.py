@@ -0,0 +1,28 @@
+"""add version column to posts table
+
+Revision ID: c2e7a95f03d8
+Revises: 5d8a2f1c7b36
+Create Date: 2026-10-18 19:47:38.665107
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "c2e7a95f03d8"
+down_revision = "5d8a2f1c7b36"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        table_name="posts",
+        column=sa.Column("version", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column(table_name="posts", column_name="version")
@@ -0,0 +1,27 @@
+"""add created_at id index to posts table
+
+Revision ID: dff290560d68
+Revises: d6ecaed3e518
+Create Date: 2026-10-18 15:10:42.518307
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "dff290560d68"
+down_revision = "d6ecaed3e518"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        index_name="ix_posts_created_at_id",
+        table_name="posts",
+        columns=["created_at", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(index_name="ix_posts_created_at_id", table_name="posts")
@@ -0,0 +1,48 @@
+"""add owner_id and user_id indexes
+
+Revision ID: f3a6d1b8c024
+Revises: c2e7a95f03d8
+Create Date: 2026-10-18 21:05:12.304918
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "f3a6d1b8c024"
+down_revision = "c2e7a95f03d8"
+branch_labels = None
+depends_on = None
+
+
+# CONCURRENTLY keeps the tables writable while the indexes build, but cannot
+# run inside a transaction. If a build fails it leaves an INVALID index
+# behind; drop it before running the upgrade again.
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            index_name="ix_posts_owner_id",
+            table_name="posts",
+            columns=["owner_id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            index_name="ix_votes_user_id",
+            table_name="votes",
+            columns=["user_id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            index_name="ix_votes_user_id",
+            table_name="votes",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            index_name="ix_posts_owner_id",
+            table_name="posts",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,148 @@
+"""Read-through cache for rendered responses.
+
+Entries are opaque values (the routers store an ETag and the JSON bytes)
+filed under a key and any number of tags; writers invalidate by tag, e.g.
+`post:42`, so they do not need to know which keys were derived from the row
+they changed.
+
+The in-process `MemoryCache` is the default. Each gunicorn worker then holds
+its own copy, so a write invalidates only the worker that served it and the
+others may serve the old entry until its TTL runs out. A shared store removes
+that window: subclass `CacheBackend` and point `CACHE_BACKEND` at it as
+`package.module:ClassName`.
+"""
+import importlib
+import threading
+import time
+from abc import ABC
+from abc import abstractmethod
+from collections import defaultdict
+from collections import OrderedDict
+from typing import Iterable
+
+from .config import settings
+
+
+class CacheBackend(ABC):
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def get(self, key: str):
+        """Return the cached value or None."""
+
+    @abstractmethod
+    def set(self, key: str, value, tags: Iterable[str] = ()):
+        """File `value` under `key` and `tags` for `ttl` seconds."""
+
+    @abstractmethod
+    def invalidate(self, *tags: str):
+        """Drop every entry filed under any of `tags`."""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every entry."""
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class NullCache(CacheBackend):
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value, tags=()):
+        pass
+
+    def invalidate(self, *tags):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """Size-bounded LRU with a per-entry TTL, local to the process."""
+
+    def __init__(self, max_entries, ttl):
+        super().__init__(max_entries, ttl)
+        self._lock = threading.Lock()
+        # key -> (value, expires_at, tags), least recently used first
+        self._entries = OrderedDict()
+        self._keys_by_tag = defaultdict(set)
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, tags=()):
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, tags)
+            for tag in tags:
+                self._keys_by_tag[tag].add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def stats(self):
+        return {
+            **super().stats(),
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag[tag]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_tag[tag]
+
+
+backends = {"memory": MemoryCache, "none": NullCache}
+
+
+def create_cache(
+    name: str,
+    max_entries: int = settings.cache_max_entries,
+    ttl: float = settings.cache_ttl_seconds,
+) -> CacheBackend:
+    if ":" in name:
+        module, cls = name.split(":", 1)
+        backend = getattr(importlib.import_module(module), cls)
+    else:
+        backend = backends[name]
+    return backend(max_entries, ttl)
+
+
+cache = create_cache(settings.cache_backend)
@@ -11,6 +11,59 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+    # changing the cost rehashes each password on its owner's next login
+    bcrypt_rounds: int = 12
+    # hashing runs in a process pool of `hash_workers` (0: one per core); at
+    # most `hash_queue_size` more requests wait for it before a 503
+    hash_workers: int = 0
+    hash_queue_size: int = 32
+    # "memory", "none" or "package.module:ClassName", see `app.cache`
+    cache_backend: str = "memory"
+    cache_ttl_seconds: float = 30
+    cache_max_entries: int = 10000
+    # rows per multi-row INSERT (and per transaction) in POST /posts/bulk
+    bulk_chunk_size: int = 1000
+    # rows fetched per server-side cursor round trip by GET /posts/export
+    export_chunk_size: int = 1000
+    # characters of `content_preview` in GET /posts/?view=summary
+    post_preview_length: int = 200
+    # trust the id and email signed into the token instead of loading the user
+    stateless_auth: bool = False
+    # reject tokens issued before the user's last logout; versions are cached
+    # per worker for `token_version_cache_seconds`
+    token_version_check: bool = False
+    token_version_cache_seconds: int = 30
+    # acknowledge votes with a 202 and write them in batches, see
+    # `app.vote_buffer` for the trade-offs
+    vote_buffer: bool = False
+    vote_buffer_flush_size: int = 500
+    vote_buffer_flush_seconds: float = 1
+    vote_buffer_max_pending: int = 10000
+    # votes per POST /vote/batch; each binds two parameters of a statement,
+    # which asyncpg caps at 32767
+    vote_batch_max_size: int = 1000
+    # serve the API from the asyncpg engine and the `async def` routers
+    database_async: bool = False
+    # Server-Timing header and a log record with the timings of each request
+    request_timing: bool = True
+    # per worker process: workers * (pool_size + max_overflow) connections
+    # must fit inside the server's max_connections
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout: float = 30
+    database_pool_recycle: int = -1
+    database_pool_pre_ping: bool = False
+    # comma-separated URLs of read replicas (postgresql://user:pw@host:port/db)
+    # for the read-only GET handlers; a replica that fails to connect is
+    # skipped for `database_replica_retry_seconds`
+    database_replica_urls: str = ""
+    database_replica_retry_seconds: float = 5
+    # read from the primary for this long after a user's own commit (0: off);
+    # the markers are kept by a backend of CACHE_BACKEND's kind ("memory" for
+    # "none"), apart from the response cache. In memory they are per worker:
+    # a read served by another worker than the write still goes to a replica,
+    # so with several workers configure a shared backend
+    read_your_writes_seconds: float = 0
 
     model_config = SettingsConfigDict(env_file=".env")
 
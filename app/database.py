@@ -1,7 +1,28 @@
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+from typing import List
+
+from fastapi import Depends
+from fastapi import Request
+from jose import jwt
+from jose import JWTError
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.pool import QueuePool
 
+from . import metrics
+from . import timing
+from .cache import create_cache
 from .config import settings
 
 
@@ -11,7 +32,95 @@ SQLALCHEMY_DATABASE_URL = (
     f"""{settings.database_name}"""
 )
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+SQLALCHEMY_ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace(
+    "postgresql://", "postgresql+asyncpg://", 1
+)
+
+
+class PoolStatsMixin:
+    """Count checkouts, time spent waiting for a connection and timeouts."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            timing.record("pool", waited)
+            metrics.pool_wait.observe(waited)
+            if timed_out:
+                metrics.pool_timeouts.inc()
+            with self._stats_lock:
+                self.checkouts += 1
+                self.timeouts += timed_out
+                self.wait_time += waited
+                self.max_wait_time = max(self.max_wait_time, waited)
+
+
+class InstrumentedQueuePool(PoolStatsMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(PoolStatsMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+pool_options = {
+    "pool_size": settings.database_pool_size,
+    "max_overflow": settings.database_max_overflow,
+    "pool_timeout": settings.database_pool_timeout,
+    "pool_recycle": settings.database_pool_recycle,
+    "pool_pre_ping": settings.database_pool_pre_ping,
+}
+
+
+# the start lives on the execution context, which goes away with the
+# statement even when it raises and `after_cursor_execute` never fires
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing.record("db", time.perf_counter() - context.query_start)
+
+
+def instrument_engine(engine):
+    """Add the SQL of every request on `engine` to its Server-Timing."""
+    # async engines fire their events on the sync engine they wrap
+    engine = getattr(engine, "sync_engine", engine)
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def instrument_pool(engine, name: str):
+    """Keep the pool gauges of /metrics current as connections come and go.
+
+    `name` labels the gauges, so that the engines do not overwrite each other.
+    """
+    engine = getattr(engine, "sync_engine", engine)
+
+    def observe_pool(*args):
+        metrics.observe_pool(engine.pool, name)
+
+    event.listen(engine, "checkout", observe_pool)
+    event.listen(engine, "checkin", observe_pool)
+
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, poolclass=InstrumentedQueuePool, **pool_options
+)
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -19,13 +128,260 @@ SessionLocal = sessionmaker(
     bind=engine,
 )
 
+# creating the engine does not connect, so this costs nothing in sync mode
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, **pool_options
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False,
+    expire_on_commit=False,
+    bind=async_engine,
+)
+
+instrument_engine(engine)
+instrument_engine(async_engine)
+instrument_pool(engine, "primary")
+instrument_pool(async_engine, "primary_async")
+
+
+class ReplicaSet:
+    """Round-robin over replica engines, skipping those that recently failed."""
+
+    def __init__(self, engines: List, retry_seconds: float):
+        self.engines = engines
+        self.retry_seconds = retry_seconds
+        self.down_until = [0.0] * len(engines)
+        self.counter = itertools.count()
+
+    def healthy(self):
+        if not self.engines:
+            return []
+        start = next(self.counter) % len(self.engines)
+        now = time.monotonic()
+        return [
+            self.engines[i % len(self.engines)]
+            for i in range(start, start + len(self.engines))
+            if self.down_until[i % len(self.engines)] <= now
+        ]
+
+    def mark_down(self, engine):
+        self.down_until[self.engines.index(engine)] = (
+            time.monotonic() + self.retry_seconds
+        )
+
+
+replica_urls = [url.strip() for url in settings.database_replica_urls.split(",")]
+replica_urls = [url for url in replica_urls if url]
+
+replicas = ReplicaSet(
+    [
+        create_engine(url, poolclass=InstrumentedQueuePool, **pool_options)
+        for url in replica_urls
+    ],
+    settings.database_replica_retry_seconds,
+)
+
+async_replicas = ReplicaSet(
+    [
+        create_async_engine(
+            url.replace("postgresql://", "postgresql+asyncpg://", 1),
+            poolclass=InstrumentedAsyncQueuePool,
+            **pool_options,
+        )
+        for url in replica_urls
+    ],
+    settings.database_replica_retry_seconds,
+)
+
+for i, replica in enumerate(replicas.engines):
+    instrument_engine(replica)
+    instrument_pool(replica, f"replica{i}")
+
+for i, replica in enumerate(async_replicas.engines):
+    instrument_engine(replica)
+    instrument_pool(replica, f"replica{i}_async")
+
+
+class ReplicaSession(Session):
+    """A read session that picks its replica when it first needs a connection.
+
+    A handler answered from the cache therefore never checks one out. The
+    healthy replicas are tried in turn and one that fails to connect is
+    marked down; with none left the session reads from `primary`.
+    """
+
+    def __init__(self, replica_set: ReplicaSet, primary, **kwargs):
+        super().__init__(**kwargs)
+        self.replica_set = replica_set
+        self.primary = primary
+
+    def get_bind(self, *args, **kwargs):
+        if self.bind is None:
+            self.bind = self.connect_replica()
+        return self.bind
+
+    def connect_replica(self):
+        for replica in self.replica_set.healthy():
+            # async engines hand their sync core to the session they wrap
+            bind = getattr(replica, "sync_engine", replica)
+            try:
+                self.connection(bind_arguments={"bind": bind})
+                return bind
+            except (exc.DBAPIError, OSError):
+                self.close()
+                self.replica_set.mark_down(replica)
+
+        return self.primary
+
+
+ReadSessionLocal = sessionmaker(
+    class_=ReplicaSession, autocommit=False, autoflush=False
+)
+
+AsyncReadSessionLocal = async_sessionmaker(
+    sync_session_class=ReplicaSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
+def pool_stats(pool):
+    stats = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # negative until the pool has opened `size` connections
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, PoolStatsMixin):
+        stats.update(
+            {
+                "checkouts": pool.checkouts,
+                "timeouts": pool.timeouts,
+                "wait_time_seconds": pool.wait_time,
+                "max_wait_time_seconds": pool.max_wait_time,
+            }
+        )
+    return stats
+
+
+def get_pool():
+    return async_engine.pool if settings.database_async else engine.pool
+
+
+def get_session_factory():
+    return SessionLocal
+
+
+def get_async_session_factory():
+    return AsyncSessionLocal
+
+
+# The request's primary session is opened on first use and kept in
+# `request.state`, so `get_current_user` and a read that falls back to the
+# primary share one; whoever opened it closes it.
+@contextmanager
+def request_session(request: Request, session_factory):
+    db = getattr(request.state, "primary_db", None)
+    if db is not None:
+        yield db
+        return
+
+    db = request.state.primary_db = session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@asynccontextmanager
+async def async_request_session(request: Request, session_factory):
+    db = getattr(request.state, "primary_db", None)
+    if db is not None:
+        yield db
+        return
+
+    db = request.state.primary_db = session_factory()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
 # Dependency
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request, session_factory=Depends(get_session_factory)):
+    with request_session(request, session_factory) as db:
+        yield db
+
+
+async def get_async_db(
+    request: Request, session_factory=Depends(get_async_session_factory)
+):
+    async with async_request_session(request, session_factory) as db:
+        yield db
+
+
+# read-your-writes markers live apart from the response cache: they must not
+# count as its misses, expire with its TTL or vanish with CACHE_BACKEND=none
+write_markers = create_cache(
+    "memory" if settings.cache_backend == "none" else settings.cache_backend,
+    ttl=settings.read_your_writes_seconds,
+)
+
+
+# `get_current_user` files the user in `Session.info`, and a commit on that
+# session starts the user's window on the primary
+@event.listens_for(Session, "after_commit")
+def mark_user_write(session):
+    user_id = session.info.get("user_id")
+    if user_id is not None and settings.read_your_writes_seconds:
+        write_markers.set(f"wrote:{user_id}", True)
+
+
+def read_from_primary(request: Request) -> bool:
+    if not settings.read_your_writes_seconds:
+        return False
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        # routing only: the handler's own auth verifies the signature
+        user_id = jwt.get_unverified_claims(token).get("user_id")
+    except JWTError:
+        return False
+
+    return write_markers.get(f"wrote:{user_id}") is not None
+
+
+# Dependency for read-only handlers: a replica, connected on first use, if
+# there are any; else the request's primary session, which is only opened then
+def get_read_db(request: Request, session_factory=Depends(get_session_factory)):
+    if not replicas.engines or read_from_primary(request):
+        with request_session(request, session_factory) as db:
+            yield db
+        return
+
+    db = ReadSessionLocal(replica_set=replicas, primary=engine)
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_read_db(
+    request: Request, session_factory=Depends(get_async_session_factory)
+):
+    if not async_replicas.engines or read_from_primary(request):
+        async with async_request_session(request, session_factory) as db:
+            yield db
+        return
+
+    db = AsyncReadSessionLocal(
+        replica_set=async_replicas, primary=async_engine.sync_engine
+    )
+    try:
+        yield db
+    finally:
+        await db.close()
@@ -0,0 +1,107 @@
+"""Streaming export of every post with its vote count.
+
+`export_query` is read through a server-side cursor (`yield_per`), so memory
+stays flat however many posts there are; the rows are rendered one chunk at a
+time as NDJSON or CSV. Served by GET /posts/export and runnable as
+
+    python -m app.export --format csv --output posts.csv
+"""
+import argparse
+import csv
+import io
+import sys
+from typing import Optional
+
+import orjson
+from sqlalchemy import select
+
+from . import models
+from .config import settings
+from .database import SessionLocal
+
+
+columns = ["id", "title", "content", "published", "created_at", "owner_id", "votes"]
+
+media_types = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_query():
+    return select(
+        models.Post.id,
+        models.Post.title,
+        models.Post.content,
+        models.Post.published,
+        models.Post.created_at,
+        models.Post.owner_id,
+        models.Post.votes_count.label("votes"),
+    ).order_by(models.Post.id)
+
+
+def ndjson_chunk(rows) -> bytes:
+    return b"".join(orjson.dumps(row._asdict()) + b"\n" for row in rows)
+
+
+def csv_chunk(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            [row.id, row.title, row.content, row.published]
+            + [row.created_at.isoformat(), row.owner_id, row.votes]
+        )
+    return buffer.getvalue().encode()
+
+
+def csv_header() -> bytes:
+    return (",".join(columns) + "\r\n").encode()
+
+
+renderers = {"ndjson": ndjson_chunk, "csv": csv_chunk}
+
+
+def export_posts(db, format: str = "ndjson", chunk_size: Optional[int] = None):
+    """Yield the export as encoded chunks of `chunk_size` rows."""
+    chunk_size = chunk_size or settings.export_chunk_size
+    render = renderers[format]
+
+    if format == "csv":
+        yield csv_header()
+
+    result = db.execute(export_query().execution_options(yield_per=chunk_size))
+    for rows in result.partitions():
+        yield render(rows)
+
+
+async def export_posts_async(
+    db, format: str = "ndjson", chunk_size: Optional[int] = None
+):
+    chunk_size = chunk_size or settings.export_chunk_size
+    render = renderers[format]
+
+    if format == "csv":
+        yield csv_header()
+
+    result = await db.stream(export_query().execution_options(yield_per=chunk_size))
+    async for rows in result.partitions():
+        yield render(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.export")
+    parser.add_argument("--format", choices=sorted(renderers), default="ndjson")
+    parser.add_argument("--output", help="file to write to (default: stdout)")
+    parser.add_argument("--chunk-size", type=int, default=settings.export_chunk_size)
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        with SessionLocal() as db:
+            for chunk in export_posts(db, args.format, args.chunk_size):
+                output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
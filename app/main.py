@@ -1,16 +1,40 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 
+from .cache import cache
+from .config import settings
+from .database import get_pool
+from .database import pool_stats
+from .metrics import metrics_response
+from .metrics import MetricsMiddleware
 from .routers import auth
 from .routers import post
 from .routers import user
 from .routers import vote
+from .routers.aio import auth as async_auth
+from .routers.aio import post as async_post
+from .routers.aio import user as async_user
+from .routers.aio import vote as async_vote
+from .timing import TimingMiddleware
+from .vote_buffer import vote_buffer
 
 
 # no longer needs this since we already use `alembic`
 # models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # buffered votes are only acknowledged, write them out before exiting;
+    # joining the flusher and the last flush block, so not on the event loop
+    await run_in_threadpool(vote_buffer.close)
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["*"]
 
@@ -22,12 +46,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(post.router)
-app.include_router(user.router)
-app.include_router(auth.router)
-app.include_router(vote.router)
+app.add_middleware(MetricsMiddleware)
+
+# added last so that it wraps everything else, CORS included
+if settings.request_timing:
+    app.add_middleware(TimingMiddleware)
+
+# both flavours serve the same API; `DATABASE_ASYNC` picks which one runs
+if settings.database_async:
+    app.include_router(async_post.router)
+    app.include_router(async_user.router)
+    app.include_router(async_auth.router)
+    app.include_router(async_vote.router)
+else:
+    app.include_router(post.router)
+    app.include_router(user.router)
+    app.include_router(auth.router)
+    app.include_router(vote.router)
 
 
 @app.get("/")
 def root():
     return {"message": "hello world"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return metrics_response()
+
+
+@app.get("/db/pool", include_in_schema=False)
+def get_pool_stats():
+    return pool_stats(get_pool())
+
+
+@app.get("/cache/stats", include_in_schema=False)
+def get_cache_stats():
+    return cache.stats()
+
+
+@app.get("/vote/buffer", include_in_schema=False)
+def get_vote_buffer_stats():
+    return vote_buffer.stats()
@@ -0,0 +1,122 @@
+"""Prometheus metrics, served at GET /metrics.
+
+Under gunicorn every worker is its own process. With
+`PROMETHEUS_MULTIPROC_DIR` set (gunicorn.conf.py does it), each worker writes
+its samples to memory-mapped files in that directory and a scrape of any
+worker aggregates all of them. The hook in gunicorn.conf.py cleans up after
+workers that exit. Without the variable, e.g. under a single uvicorn
+process, the default in-memory registry is served.
+
+Recording a sample is a dict lookup and an mmap write, and the routes are
+labelled by their template (`/posts/{id}`) rather than the raw path, so the
+number of series stays fixed.
+"""
+import os
+import time
+
+from fastapi import Response
+from prometheus_client import CollectorRegistry
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import generate_latest
+from prometheus_client import Histogram
+from prometheus_client import multiprocess
+from prometheus_client import REGISTRY
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending its response.",
+    ["method", "route", "status"],
+)
+
+requests_in_progress = Gauge(
+    "http_requests_in_progress",
+    "Requests being served.",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+
+# one series per engine: the sync and async primaries and each replica
+pool_checked_out = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections checked out of the pool.",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+
+pool_size = Gauge(
+    "db_pool_connections",
+    "Connections held by the pool, checked out or not.",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+
+pool_wait = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting for a pooled connection.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+pool_timeouts = Counter(
+    "db_pool_timeouts",
+    "Checkouts that gave up after waiting `pool_timeout`.",
+)
+
+password_hash_duration = Histogram(
+    "password_hash_duration_seconds",
+    "Time for a bcrypt job in the hashing pool, including its queueing.",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+
+def observe_pool(pool, name: str):
+    pool_checked_out.labels(name).set(pool.checkedout())
+    pool_size.labels(name).set(pool.checkedin() + pool.checkedout())
+
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    # unmatched paths share one label instead of adding a series each
+    return route.path if route is not None else "<unmatched>"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = requests_in_progress.labels(method)
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            request_duration.labels(method, route_template(scope), status_code).observe(
+                time.perf_counter() - start
+            )
+
+
+def metrics_response():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
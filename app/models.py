@@ -1,15 +1,25 @@
 from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import Computed
+from sqlalchemy import extract
+from sqlalchemy import Float
 from sqlalchemy import ForeignKey
+from sqlalchemy import func
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
 from sqlalchemy import text
 from sqlalchemy import TIMESTAMP
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy.orm import relationship
 
 from .database import Base
 
 
+TRENDING_DECAY_SECONDS = 45000
+
+
 class Post(Base):
     __tablename__ = "posts"
 
@@ -23,9 +33,56 @@ class Post(Base):
     owner_id = Column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
+    # denormalized count of `votes` rows, kept in step by the vote router
+    votes_count = Column(Integer, server_default="0", nullable=False)
+    # bumped by every write the post's responses show (edits and votes), so
+    # (id, version) is its ETag
+    version = Column(Integer, server_default="0", nullable=False)
+    # ranking of GET /posts/top?order=trending, see `trending_score`; a new
+    # post starts from its creation time with no votes
+    trending_score = Column(
+        Float,
+        server_default=text(f"extract(epoch from now()) / {TRENDING_DECAY_SECONDS}"),
+        nullable=False,
+    )
+    # full-text search document, generated by Postgres; deferred so that it is
+    # never loaded with the row
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                "setweight(to_tsvector('english', title), 'A') || "
+                "setweight(to_tsvector('english', content), 'B')",
+                persisted=True,
+            ),
+        )
+    )
 
     owner = relationship("User")
 
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_posts_votes_count_id", "votes_count", "id"),
+        Index("ix_posts_trending_score_id", "trending_score", "id"),
+        # the cascade from users and any per-owner lookup; created_at is led
+        # by ix_posts_created_at_id already
+        Index("ix_posts_owner_id", "owner_id"),
+    )
+
+
+def trending_score(votes_count):
+    """Score of a post with `votes_count` votes, for an UPDATE of `posts`.
+
+    Every tenfold of votes is worth TRENDING_DECAY_SECONDS of recency, so
+    old posts sink without the scores ever being recomputed: only a vote
+    changes a post's score, and the vote statements set it with the count.
+    """
+    return (
+        func.log(func.greatest(votes_count, 1))
+        + extract("epoch", Post.created_at) / TRENDING_DECAY_SECONDS
+    )
+
 
 class User(Base):
     __tablename__ = "users"
@@ -36,6 +93,8 @@ class User(Base):
     created_at = Column(
         TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
     )
+    # bumped on logout; tokens signed with an older version are rejected
+    token_version = Column(Integer, server_default="0", nullable=False)
 
 
 class Vote(Base):
@@ -53,3 +112,6 @@ class Vote(Base):
         primary_key=True,
         nullable=False,
     )
+
+    # the primary key leads with post_id, so a user's votes need their own
+    __table_args__ = (Index("ix_votes_user_id", "user_id"),)
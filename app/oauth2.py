@@ -1,6 +1,8 @@
+import time
 from datetime import datetime
 from datetime import timedelta
 from typing import Dict
+from typing import Tuple
 
 from fastapi import Depends
 from fastapi import HTTPException
@@ -8,12 +10,16 @@ from fastapi import status
 from fastapi.security.oauth2 import OAuth2PasswordBearer
 from jose import jwt
 from jose import JWTError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from . import models
 from . import schemas
 from .config import settings
+from .database import get_async_db
 from .database import get_db
+from .timing import measure
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -38,6 +44,13 @@ def create_access_token(data: Dict, expires_delta: timedelta = None):
     return encoded_jwt
 
 
+def create_user_access_token(user: models.User):
+    # everything a stateless principal needs, see `get_current_user`
+    return create_access_token(
+        data={"user_id": user.id, "email": user.email, "ver": user.token_version}
+    )
+
+
 def verify_access_token(token: str, credentials_exception):
     try:
         payload = jwt.decode(
@@ -49,24 +62,125 @@ def verify_access_token(token: str, credentials_exception):
         if not id:
             raise credentials_exception
 
-        token_data = schemas.TokenData(id=id)
+        token_data = schemas.TokenData(
+            id=id, email=payload.get("email"), version=payload.get("ver")
+        )
     except JWTError:
         raise credentials_exception
 
     return token_data
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
+def get_credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    token = verify_access_token(token, credentials_exception)
 
-    user = db.query(models.User).where(models.User.id == token.id).first()
+# user id -> (token version, monotonic expiry); local to the worker process
+token_versions: Dict[int, Tuple[int, float]] = {}
+
+
+def get_cached_token_version(id: int):
+    cached = token_versions.get(id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    return None
+
+
+def cache_token_version(id: int, version: int):
+    token_versions[id] = (
+        version,
+        time.monotonic() + settings.token_version_cache_seconds,
+    )
+
+
+def check_token_version(token: schemas.TokenData, version, credentials_exception):
+    # tokens issued before versioning existed carry no claim and count as 0
+    if settings.token_version_check and (token.version or 0) != version:
+        raise credentials_exception
+
+
+# A stateless token outlives its user, whose writes then fail the foreign key
+# to users instead of the lookup below. Called after such an IntegrityError
+# has been rolled back, to answer 401 rather than 500. The id is the one
+# `get_current_user` left in `db.info`, which outlives the rollback.
+def check_user_exists(db: Session):
+    id = db.info["user_id"]
+    if db.scalar(select(models.User.id).where(models.User.id == id)) is None:
+        raise get_credentials_exception()
+
+
+async def check_user_exists_async(db: AsyncSession):
+    id = db.info["user_id"]
+    if await db.scalar(select(models.User.id).where(models.User.id == id)) is None:
+        raise get_credentials_exception()
+
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+):
+    with measure("auth"):
+        credentials_exception = get_credentials_exception()
+        token = verify_access_token(token, credentials_exception)
+
+        # stateless mode: the token itself is the principal, no user lookup
+        if settings.stateless_auth and token.email:
+            if settings.token_version_check:
+                version = get_cached_token_version(token.id)
+                if version is None:
+                    version = (
+                        db.query(models.User.token_version)
+                        .where(models.User.id == token.id)
+                        .scalar()
+                    )
+                    cache_token_version(token.id, version)
+                check_token_version(token, version, credentials_exception)
+
+            db.info["user_id"] = token.id
+            return token
+
+        user = db.query(models.User).where(models.User.id == token.id).first()
+
+        if not user:
+            raise credentials_exception
+
+        check_token_version(token, user.token_version, credentials_exception)
+
+        db.info["user_id"] = user.id
+        return user
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+):
+    with measure("auth"):
+        credentials_exception = get_credentials_exception()
+        token = verify_access_token(token, credentials_exception)
+
+        if settings.stateless_auth and token.email:
+            if settings.token_version_check:
+                version = get_cached_token_version(token.id)
+                if version is None:
+                    version = await db.scalar(
+                        select(models.User.token_version).where(
+                            models.User.id == token.id
+                        )
+                    )
+                    cache_token_version(token.id, version)
+                check_token_version(token, version, credentials_exception)
+
+            db.info["user_id"] = token.id
+            return token
+
+        user = await db.scalar(select(models.User).where(models.User.id == token.id))
+
+        if not user:
+            raise credentials_exception
+
+        check_token_version(token, user.token_version, credentials_exception)
 
-    return user
+        db.info["user_id"] = user.id
+        return user
@@ -0,0 +1,77 @@
+from fastapi import APIRouter
+from fastapi import Depends
+from fastapi import HTTPException
+from fastapi import Response
+from fastapi import status
+from fastapi.security.oauth2 import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ... import models
+from ... import oauth2
+from ... import schemas
+from ... import utils
+from ...database import get_async_db
+from ...timing import TimedRoute
+
+
+router = APIRouter(tags=["Authentication"], route_class=TimedRoute)
+
+
+@router.post("/login", response_model=schemas.Token)
+async def login(
+    user_credentials: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    user = await db.scalar(
+        select(models.User).where(models.User.email == user_credentials.username)
+    )
+
+    # verify credentials
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid Credentials!",
+        )
+
+    verified, new_hash = await utils.verify_and_update_async(
+        user_credentials.password, user.password
+    )
+
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid Credentials!",
+        )
+
+    # the bcrypt cost changed since this hash was made
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+
+    # create a token
+    access_token = oauth2.create_user_access_token(user)
+
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+    }
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(oauth2.get_current_user_async),
+):
+    # invalidates every token issued to the user so far
+    await db.execute(
+        update(models.User)
+        .where(models.User.id == current_user.id)
+        .values(token_version=models.User.token_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    oauth2.token_versions.pop(current_user.id, None)
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
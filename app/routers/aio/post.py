@@ -0,0 +1,292 @@
+from typing import List
+from typing import Literal
+from typing import Optional
+
+from fastapi import APIRouter
+from fastapi import Depends
+from fastapi import Header
+from fastapi import HTTPException
+from fastapi import Request
+from fastapi import Response
+from fastapi import status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from ... import export
+from ... import models
+from ... import oauth2
+from ... import schemas
+from ... import serializers
+from ... import utils
+from ...cache import cache
+from ...config import settings
+from ...database import get_async_db
+from ...database import get_async_read_db
+from ...timing import TimedRoute
+from ..post import bulk_posts_openapi
+from ..post import delete_post_statement
+from ..post import etag_fields
+from ..post import filter_posts
+from ..post import next_cursor_headers
+from ..post import order_top_posts
+from ..post import page_response
+from ..post import partial_bulk_response
+from ..post import post_write_error
+from ..post import probe_first
+from ..post import read_bulk_posts
+from ..post import select_sparse_posts
+from ..post import sparse_fields
+from ..post import update_post_statement
+
+
+router = APIRouter(
+    prefix="/posts",
+    tags=["Posts"],
+    default_response_class=ORJSONResponse,
+    route_class=TimedRoute,
+)
+
+
+# lazy loads cannot run under asyncio, so the owner always comes with the post
+def select_posts():
+    return select(models.Post, models.Post.votes_count.label("votes")).options(
+        joinedload(models.Post.owner)
+    )
+
+
+# re-read after a write; populate_existing overwrites the stale identity
+async def get_post_with_owner(db: AsyncSession, id: int):
+    return await db.scalar(
+        select(models.Post)
+        .options(joinedload(models.Post.owner))
+        .where(models.Post.id == id)
+        .execution_options(populate_existing=True)
+    )
+
+
+@router.get("/", response_model=List[schemas.PostOut])
+async def get_posts(
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(oauth2.get_current_user_async),
+    limit: int = 10,
+    skip: int = 0,
+    search: Optional[str] = "",
+    search_content: bool = False,
+    sort: Literal["recent", "relevance"] = "recent",
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    view: Literal["full", "summary"] = "full",
+    if_none_match: Optional[str] = Header(None),
+):
+    sparse = sparse_fields(fields, view)
+    tagged_fields = etag_fields(sparse)
+
+    if if_none_match and probe_first(skip, search):
+        probe, ranked = filter_posts(
+            select(models.Post.id, models.Post.version, models.Post.created_at),
+            search,
+            search_content,
+            sort,
+            cursor,
+            skip,
+        )
+        keys = (await db.execute(probe.limit(limit))).all()
+        etag = utils.page_etag(((row.id, row.version) for row in keys), tagged_fields)
+        if utils.etag_matches(if_none_match, etag):
+            return serializers.not_modified(
+                etag, next_cursor_headers(keys, limit, ranked)
+            )
+
+    if sparse is not None:
+        query, ranked = filter_posts(
+            select_sparse_posts(sparse), search, search_content, sort, cursor, skip
+        )
+        rows = (await db.execute(query.limit(limit))).all()
+
+        return page_response(
+            if_none_match,
+            utils.page_etag(((row.id, row.version) for row in rows), tagged_fields),
+            next_cursor_headers(rows, limit, ranked),
+            lambda: serializers.sparse_posts_out(rows, sparse),
+        )
+
+    query, ranked = filter_posts(
+        select_posts(), search, search_content, sort, cursor, skip
+    )
+    posts = (await db.execute(query.limit(limit))).all()
+
+    return page_response(
+        if_none_match,
+        utils.page_etag((row.Post.id, row.Post.version) for row in posts),
+        next_cursor_headers([row.Post for row in posts], limit, ranked),
+        lambda: serializers.posts_out(posts),
+    )
+
+
+@router.get("/top", response_model=List[schemas.PostOut])
+async def get_top_posts(
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(oauth2.get_current_user_async),
+    order: Literal["votes", "trending"] = "votes",
+    limit: int = 10,
+    skip: int = 0,
+):
+    query = order_top_posts(select_posts(), order).offset(skip).limit(limit)
+    posts = (await db.execute(query)).all()
+
+    return serializers.response(serializers.posts_out(posts))
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_posts(
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(oauth2.get_current_user_async),
+    format: Literal["ndjson", "csv"] = "ndjson",
+):
+    return StreamingResponse(
+        export.export_posts_async(db, format), media_type=export.media_types[format]
+    )
+
+
+@router.get("/{id}", response_model=schemas.PostOut)
+async def get_post(
+    id: int,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(oauth2.get_current_user_async),
+    if_none_match: Optional[str] = Header(None),
+):
+    key = f"post:{id}"
+    cached = cache.get(key)
+
+    if cached is None and if_none_match:
+        version = await db.scalar(
+            select(models.Post.version).where(models.Post.id == id)
+        )
+        if version is not None:
+            etag = utils.post_etag(id, version)
+            if utils.etag_matches(if_none_match, etag):
+                return serializers.not_modified(etag)
+
+    if cached is None:
+        post = (await db.execute(select_posts().where(models.Post.id == id))).first()
+
+        if not post:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"post with id: {id} was not found",
+            )
+
+        etag = utils.post_etag(id, post.Post.version)
+        cached = (etag, serializers.dumps(serializers.post_out(post)))
+        cache.set(key, cached, tags=[key])
+
+    etag, body = cached
+    if utils.etag_matches(if_none_match, etag):
+        return serializers.not_modified(etag)
+
+    return serializers.raw_response(body, headers={"ETag": etag})
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.Post)
+async def create_posts(
+    post: schemas.PostCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(oauth2.get_current_user_async),
+):
+    new_post = models.Post(**post.model_dump(), owner_id=current_user.id)
+    db.add(new_post)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        await oauth2.check_user_exists_async(db)
+        raise
+
+    return serializers.response(
+        serializers.post(await get_post_with_owner(db, new_post.id)),
+        status_code=status.HTTP_201_CREATED,
+    )
+
+
+async def insert_posts(
+    db: AsyncSession, posts: List[schemas.PostCreate], owner_id: int
+):
+    ids = (
+        await db.scalars(
+            insert(models.Post).returning(models.Post.id, sort_by_parameter_order=True),
+            [{**post.model_dump(), "owner_id": owner_id} for post in posts],
+        )
+    ).all()
+    await db.commit()
+    return ids
+
+
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=schemas.PostBulkOut,
+    openapi_extra=bulk_posts_openapi,
+)
+async def create_posts_bulk(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(oauth2.get_current_user_async),
+):
+    ids = []
+    try:
+        async for posts in read_bulk_posts(request, settings.bulk_chunk_size):
+            ids.extend(await insert_posts(db, posts, current_user.id))
+    except RequestValidationError as e:
+        if not ids:
+            raise
+        return partial_bulk_response(e, ids)
+    except IntegrityError:
+        await db.rollback()
+        await oauth2.check_user_exists_async(db)
+        raise
+
+    return serializers.response({"ids": ids}, status_code=status.HTTP_201_CREATED)
+
+
+@router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_post(
+    id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(oauth2.get_current_user_async),
+):
+    deleted = await db.scalar(delete_post_statement(id, current_user.id))
+
+    if deleted is None:
+        raise post_write_error(await db.get(models.Post, id), id)
+
+    await db.commit()
+    cache.invalidate(f"post:{id}")
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.put("/{id}", response_model=schemas.Post)
+async def update_post(
+    id: int,
+    post: schemas.PostCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(oauth2.get_current_user_async),
+):
+    updated = (
+        await db.execute(update_post_statement(id, post, current_user.id))
+    ).first()
+
+    if updated is None:
+        raise post_write_error(await db.get(models.Post, id), id)
+
+    await db.commit()
+    cache.invalidate(f"post:{id}")
+
+    # the owner came back in the same row, so no lazy load is needed
+    return serializers.response(serializers.post(updated[0]))
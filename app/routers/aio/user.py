@@ -0,0 +1,71 @@
+from typing import Optional
+
+from fastapi import APIRouter
+from fastapi import Depends
+from fastapi import Header
+from fastapi import HTTPException
+from fastapi import status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ... import models
+from ... import schemas
+from ... import serializers
+from ... import utils
+from ...cache import cache
+from ...database import get_async_db
+from ...database import get_async_read_db
+from ...timing import TimedRoute
+
+
+router = APIRouter(
+    prefix="/users",
+    tags=["Users"],
+    default_response_class=ORJSONResponse,
+    route_class=TimedRoute,
+)
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.UserOut)
+async def create_user(
+    user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)
+):
+    # hash and replace user's password
+    user.password = await utils.hash_async(user.password)
+
+    new_user = models.User(**user.model_dump())
+    db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    return serializers.response(
+        serializers.user_out(new_user), status_code=status.HTTP_201_CREATED
+    )
+
+
+@router.get("/{id}", response_model=schemas.UserOut)
+async def get_user(
+    id: int,
+    db: AsyncSession = Depends(get_async_read_db),
+    if_none_match: Optional[str] = Header(None),
+):
+    key = f"user:{id}"
+    cached = cache.get(key)
+
+    if cached is None:
+        user = await db.get(models.User, id)
+
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"user with {id} does not exist",
+            )
+
+        etag = utils.user_etag(user.id, user.created_at)
+        cached = (etag, serializers.dumps(serializers.user_out(user)))
+        cache.set(key, cached, tags=[key])
+
+    etag, body = cached
+    if utils.etag_matches(if_none_match, etag):
+        return serializers.not_modified(etag)
+
+    return serializers.raw_response(body, headers={"ETag": etag})
@@ -0,0 +1,135 @@
+from typing import List
+
+from fastapi import APIRouter
+from fastapi import Body
+from fastapi import Depends
+from fastapi import HTTPException
+from fastapi import status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ... import models
+from ... import schemas
+from ... import serializers
+from ...cache import cache
+from ...config import settings
+from ...database import get_async_db
+from ...oauth2 import check_user_exists_async
+from ...oauth2 import get_current_user_async
+from ...timing import TimedRoute
+from ...vote_buffer import vote_buffer
+from ..vote import add_votes_statement
+from ..vote import apply_votes_statements
+from ..vote import plan_votes
+from ..vote import post_not_found
+from ..vote import remove_votes_statement
+
+
+router = APIRouter(
+    prefix="/vote",
+    tags=["Votes"],
+    default_response_class=ORJSONResponse,
+    route_class=TimedRoute,
+)
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def vote(
+    vote: schemas.Vote,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: int = Depends(get_current_user_async),
+):
+    if settings.vote_buffer:
+        if not await db.get(models.Post, vote.post_id):
+            raise post_not_found(vote.post_id)
+
+        vote_buffer.add(vote.post_id, current_user.id, vote.dir)
+
+        return serializers.response(
+            {"message": "vote accepted"}, status_code=status.HTTP_202_ACCEPTED
+        )
+
+    if vote.dir == 1:
+        try:
+            added = await db.scalar(
+                add_votes_statement(current_user.id, [vote.post_id])
+            )
+        except IntegrityError:
+            await db.rollback()
+            await check_user_exists_async(db)
+            raise post_not_found(vote.post_id)
+
+        if not added:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=(
+                    f"""User {current_user.email} has already """
+                    f"""voted on post {vote.post_id}"""
+                ),
+            )
+
+        await db.commit()
+        cache.invalidate(f"post:{vote.post_id}")
+
+        return {"message": "successfully added vote"}
+    else:
+        removed = await db.scalar(
+            remove_votes_statement(current_user.id, [vote.post_id])
+        )
+
+        if not removed:
+            if not await db.get(models.Post, vote.post_id):
+                raise post_not_found(vote.post_id)
+
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Vote does not exist"
+            )
+
+        await db.commit()
+        cache.invalidate(f"post:{vote.post_id}")
+
+        return {"message": "successfully deleted vote"}
+
+
+@router.post("/batch", response_model=List[schemas.VoteResult])
+async def vote_batch(
+    votes: List[schemas.Vote] = Body(max_length=settings.vote_batch_max_size),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: int = Depends(get_current_user_async),
+):
+    requested = {vote.post_id for vote in votes}
+
+    post_ids = set(
+        await db.scalars(select(models.Post.id).where(models.Post.id.in_(requested)))
+    )
+    voted_post_ids = set(
+        await db.scalars(
+            select(models.Vote.post_id).where(
+                models.Vote.user_id == current_user.id,
+                models.Vote.post_id.in_(requested),
+            )
+        )
+    )
+
+    results, to_insert, to_delete = plan_votes(
+        votes, post_ids, voted_post_ids, current_user.email
+    )
+
+    try:
+        for statement in apply_votes_statements(current_user.id, to_insert, to_delete):
+            await db.execute(statement)
+        await db.commit()
+    except IntegrityError:
+        # a post deleted since it was looked up
+        await db.rollback()
+        await check_user_exists_async(db)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="A post of the batch no longer exists",
+        )
+
+    cache.invalidate(*(f"post:{post_id}" for post_id in to_insert | to_delete))
+
+    return serializers.response(results)
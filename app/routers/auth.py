@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import HTTPException
+from fastapi import Response
 from fastapi import status
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
@@ -10,9 +11,10 @@ from .. import oauth2
 from .. import schemas
 from .. import utils
 from ..database import get_db
+from ..timing import TimedRoute
 
 
-router = APIRouter(tags=["Authentication"])
+router = APIRouter(tags=["Authentication"], route_class=TimedRoute)
 
 
 @router.post("/login", response_model=schemas.Token)
@@ -33,16 +35,43 @@ def login(
             detail="Invalid Credentials!",
         )
 
-    if not utils.verify(user_credentials.password, user.password):
+    verified, new_hash = utils.verify_and_update(
+        user_credentials.password, user.password
+    )
+
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid Credentials!",
         )
 
+    # the bcrypt cost changed since this hash was made
+    if new_hash:
+        user.password = new_hash
+        db.commit()
+
     # create a token
-    access_token = oauth2.create_access_token(data={"user_id": user.id})
+    access_token = oauth2.create_user_access_token(user)
 
     return {
         "access_token": access_token,
         "token_type": "bearer",
     }
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(oauth2.get_current_user),
+):
+    # invalidates every token issued to the user so far; the id is read
+    # before the commit expires the user, which would reload it
+    user_id = current_user.id
+    db.query(models.User).where(models.User.id == user_id).update(
+        {models.User.token_version: models.User.token_version + 1},
+        synchronize_session=False,
+    )
+    db.commit()
+    oauth2.token_versions.pop(user_id, None)
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
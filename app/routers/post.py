@@ -1,78 +1,396 @@
 from typing import List
+from typing import Literal
 from typing import Optional
 
 from fastapi import APIRouter
 from fastapi import Depends
+from fastapi import Header
 from fastapi import HTTPException
+from fastapi import Request
 from fastapi import Response
 from fastapi import status
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from pydantic import ValidationError
+from sqlalchemy import delete
 from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy import literal_column
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
+from .. import export
 from .. import models
 from .. import oauth2
 from .. import schemas
+from .. import serializers
+from .. import utils
+from ..cache import cache
+from ..config import settings
 from ..database import get_db
+from ..database import get_read_db
+from ..timing import TimedRoute
 
 
 router = APIRouter(
     prefix="/posts",
     tags=["Posts"],
+    default_response_class=ORJSONResponse,
+    route_class=TimedRoute,
 )
 
 
+def filter_posts(query, search, search_content, sort, cursor, skip):
+    """Apply the search, ordering and paging of `get_posts` to `query`.
+
+    `query` may be a legacy `Query` or a 2.0 `select()`, so the sync and the
+    async routers share one definition of the listing.
+    """
+    ranked = sort == "relevance" and bool(search)
+    if ranked and cursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="cursor pagination is only available for sort=recent",
+        )
+
+    # full-text match against the GIN-indexed `search_vector`; without
+    # `search_content` the match is narrowed to the title's lexemes
+    if search:
+        ts_query = func.websearch_to_tsquery("english", search)
+        query = query.where(models.Post.search_vector.op("@@")(ts_query))
+
+        if not search_content:
+            title_vector = func.ts_filter(
+                models.Post.search_vector, literal_column("""'{a}'::"char"[]""")
+            )
+            query = query.where(title_vector.op("@@")(ts_query))
+
+    if ranked:
+        query = query.order_by(
+            func.ts_rank_cd(models.Post.search_vector, ts_query).desc(),
+            models.Post.id.desc(),
+        )
+    else:
+        # newest first; (created_at, id) is a stable key backed by an index, so
+        # a cursor page seeks straight to its first row instead of skipping rows
+        query = query.order_by(models.Post.created_at.desc(), models.Post.id.desc())
+
+    if cursor:
+        try:
+            created_at, post_id = utils.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"invalid cursor: {cursor}",
+            )
+
+        query = query.where(
+            tuple_(models.Post.created_at, models.Post.id) < tuple_(created_at, post_id)
+        )
+    else:
+        query = query.offset(skip)
+
+    return query, ranked
+
+
+def next_cursor_headers(posts, limit, ranked):
+    # a full page means there may be more; hand out the key of its last row
+    if not ranked and limit > 0 and len(posts) == limit:
+        last = posts[-1]
+        return {"X-Next-Cursor": utils.encode_cursor(last.created_at, last.id)}
+    return {}
+
+
+def probe_first(skip: int, search: Optional[str]) -> bool:
+    # the first page and cursor pages are an index seek for their keys
+    return not skip and not search
+
+
+def page_response(if_none_match, etag, cursor_headers, render):
+    """A page of posts, or a 304 that keeps its cursor if `etag` matches."""
+    if utils.etag_matches(if_none_match, etag):
+        return serializers.not_modified(etag, cursor_headers)
+
+    return serializers.response(render(), headers={**cursor_headers, "ETag": etag})
+
+
+# what `fields=` may name, in the order they are returned
+post_fields = (
+    "id",
+    "title",
+    "content",
+    "content_preview",
+    "published",
+    "created_at",
+    "owner_id",
+    "owner",
+)
+
+summary_fields = (
+    "id",
+    "title",
+    "content_preview",
+    "published",
+    "created_at",
+    "owner_id",
+)
+
+
+def sparse_fields(fields: Optional[str], view: str) -> Optional[List[str]]:
+    """The post fields a listing asked for, or None for whole posts.
+
+    `fields` and `view=summary` are alternatives, so sending both is a 400.
+    """
+    if fields is None:
+        return list(summary_fields) if view == "summary" else None
+
+    if view != "full":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="pass either fields or view=summary, not both",
+        )
+
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    if not names:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="fields must name at least one field",
+        )
+
+    unknown = names.difference(post_fields)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"unknown fields: {', '.join(sorted(unknown))}",
+        )
+    return [name for name in post_fields if name in names]
+
+
+def etag_fields(fields: Optional[List[str]]) -> Optional[List[str]]:
+    # a preview of another length is another representation of the page
+    if fields is None:
+        return None
+    return [
+        f"{name}={settings.post_preview_length}" if name == "content_preview" else name
+        for name in fields
+    ]
+
+
+def select_sparse_posts(fields: List[str]):
+    """Select only `fields` of the posts; shared by the sync and async routers.
+
+    `content` is not read unless asked for, `content_preview` reads the
+    first `post_preview_length` characters of it, and users are only joined
+    for `owner`. The cursor key, version and votes are always selected.
+    """
+    columns = {
+        "id": models.Post.id,
+        "created_at": models.Post.created_at,
+        "version": models.Post.version,
+        "votes": models.Post.votes_count.label("votes"),
+    }
+    for name in fields:
+        if name == "content_preview":
+            columns[name] = func.substr(
+                models.Post.content, 1, settings.post_preview_length
+            ).label(name)
+        elif name == "owner":
+            columns["owner_id"] = models.Post.owner_id
+            columns["owner_email"] = models.User.email.label("owner_email")
+            columns["owner_created_at"] = models.User.created_at.label(
+                "owner_created_at"
+            )
+        else:
+            columns[name] = getattr(models.Post, name)
+
+    query = select(*columns.values())
+    if "owner" in fields:
+        query = query.join(models.User, models.User.id == models.Post.owner_id)
+    return query
+
+
 @router.get("/", response_model=List[schemas.PostOut])
 def get_posts(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(oauth2.get_current_user),
     limit: int = 10,
     skip: int = 0,
     search: Optional[str] = "",
+    search_content: bool = False,
+    sort: Literal["recent", "relevance"] = "recent",
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    view: Literal["full", "summary"] = "full",
+    if_none_match: Optional[str] = Header(None),
 ):
     ## Using Raw SQL ##
     # cursor.execute("SELECT * FROM posts")
     # posts = cursor.fetchall()
 
     ## Using ORM - SQLAlchemy ##
+    # `fields=title,owner` or `view=summary` trim every post to those fields
+    sparse = sparse_fields(fields, view)
+    tagged_fields = etag_fields(sparse)
+
+    # a poll that would get the same page is answered from the page's
+    # (id, version) keys, before any owner is joined or body serialized. Only
+    # pages that seek straight to their rows are probed: behind an offset or
+    # a search, a changed page would pay for its scan twice.
+    if if_none_match and probe_first(skip, search):
+        probe, ranked = filter_posts(
+            db.query(models.Post.id, models.Post.version, models.Post.created_at),
+            search,
+            search_content,
+            sort,
+            cursor,
+            skip,
+        )
+        keys = probe.limit(limit).all()
+        etag = utils.page_etag(((row.id, row.version) for row in keys), tagged_fields)
+        if utils.etag_matches(if_none_match, etag):
+            return serializers.not_modified(
+                etag, next_cursor_headers(keys, limit, ranked)
+            )
+
+    if sparse is not None:
+        query, ranked = filter_posts(
+            select_sparse_posts(sparse),
+            search,
+            search_content,
+            sort,
+            cursor,
+            skip,
+        )
+        rows = db.execute(query.limit(limit)).all()
+
+        return page_response(
+            if_none_match,
+            utils.page_etag(((row.id, row.version) for row in rows), tagged_fields),
+            next_cursor_headers(rows, limit, ranked),
+            lambda: serializers.sparse_posts_out(rows, sparse),
+        )
+
+    # owners come in the same query; a lazy `owner` would cost one SELECT per
+    # distinct owner on the page once the response is serialized
+    query, ranked = filter_posts(
+        db.query(models.Post, models.Post.votes_count.label("votes")).options(
+            joinedload(models.Post.owner)
+        ),
+        search,
+        search_content,
+        sort,
+        cursor,
+        skip,
+    )
+    posts = query.limit(limit).all()
+
+    return page_response(
+        if_none_match,
+        utils.page_etag((row.Post.id, row.Post.version) for row in posts),
+        next_cursor_headers([row.Post for row in posts], limit, ranked),
+        lambda: serializers.posts_out(posts),
+    )
+
+
+def order_top_posts(query, order):
+    # both orders walk an index on (column, id) from its end, so a page costs
+    # the same however many posts and votes there are
+    column = models.Post.votes_count if order == "votes" else models.Post.trending_score
+    return query.order_by(column.desc(), models.Post.id.desc())
+
+
+# declared before "/{id}" so "top" is not taken for a post id
+@router.get("/top", response_model=List[schemas.PostOut])
+def get_top_posts(
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(oauth2.get_current_user),
+    order: Literal["votes", "trending"] = "votes",
+    limit: int = 10,
+    skip: int = 0,
+):
     posts = (
-        db.query(models.Post, func.count(models.Vote.post_id).label("votes"))
-        .join(models.Vote, models.Vote.post_id == models.Post.id, isouter=True)
-        .group_by(models.Post.id)
-        .where(models.Post.title.contains(search))
-        .limit(limit)
+        order_top_posts(
+            db.query(models.Post, models.Post.votes_count.label("votes")).options(
+                joinedload(models.Post.owner)
+            ),
+            order,
+        )
         .offset(skip)
+        .limit(limit)
         .all()
     )
 
-    return posts
+    return serializers.response(serializers.posts_out(posts))
+
+
+# declared before "/{id}" so "export" is not taken for a post id
+@router.get("/export", response_class=StreamingResponse)
+def export_posts(
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(oauth2.get_current_user),
+    format: Literal["ndjson", "csv"] = "ndjson",
+):
+    # the session stays open until the response has been streamed
+    return StreamingResponse(
+        export.export_posts(db, format), media_type=export.media_types[format]
+    )
 
 
 @router.get("/{id}", response_model=schemas.PostOut)
 def get_post(
     id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(oauth2.get_current_user),
+    if_none_match: Optional[str] = Header(None),
 ):
     ## Using Raw SQL ##
     # cursor.execute("""SELECT * FROM posts WHERE id = %s""", str(id))
     # post = cursor.fetchone()
 
     ## Using ORM - SQLAlchemy ##
-    post = (
-        db.query(models.Post, func.count(models.Vote.post_id).label("votes"))
-        .join(models.Vote, models.Vote.post_id == models.Post.id, isouter=True)
-        .where(models.Post.id == id)
-        .group_by(models.Post.id)
-        .first()
-    )
+    key = f"post:{id}"
+    cached = cache.get(key)
 
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"post with id: {id} was not found",
+    # a conditional request needs only the version, not the post
+    if cached is None and if_none_match:
+        version = db.scalar(select(models.Post.version).where(models.Post.id == id))
+        if version is not None:
+            etag = utils.post_etag(id, version)
+            if utils.etag_matches(if_none_match, etag):
+                return serializers.not_modified(etag)
+
+    if cached is None:
+        post = (
+            db.query(models.Post, models.Post.votes_count.label("votes"))
+            .options(joinedload(models.Post.owner))
+            .where(models.Post.id == id)
+            .first()
         )
 
-    return post
+        if not post:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"post with id: {id} was not found",
+            )
+
+        etag = utils.post_etag(id, post.Post.version)
+        cached = (etag, serializers.dumps(serializers.post_out(post)))
+        cache.set(key, cached, tags=[key])
+
+    etag, body = cached
+    if utils.etag_matches(if_none_match, etag):
+        return serializers.not_modified(etag)
+
+    return serializers.raw_response(body, headers={"ETag": etag})
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.Post)
@@ -92,9 +410,189 @@ def create_posts(
     ## Using ORM - SQLAlchemy ##
     new_post = models.Post(**post.model_dump(), owner_id=current_user.id)
     db.add(new_post)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        oauth2.check_user_exists(db)
+        raise
     db.refresh(new_post)  # equivalent to RETURNING * SQL
-    return new_post
+    return serializers.response(
+        serializers.post(new_post), status_code=status.HTTP_201_CREATED
+    )
+
+
+bulk_posts_adapter = TypeAdapter(List[schemas.PostCreate])
+
+bulk_posts_openapi = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": {
+                    "type": "array",
+                    "items": {"$ref": "#/components/schemas/PostCreate"},
+                }
+            },
+            "application/x-ndjson": {
+                "schema": {"$ref": "#/components/schemas/PostCreate"}
+            },
+        },
+    }
+}
+
+
+def validation_error(e: ValidationError, *loc):
+    return RequestValidationError(
+        [{**error, "loc": ("body", *loc, *error["loc"])} for error in e.errors()]
+    )
+
+
+async def read_lines(request: Request):
+    buffer = b""
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+
+    # the last line need not end with a newline
+    yield buffer
+
+
+async def read_json_posts(request: Request):
+    # a JSON array is validated as a whole before the first post is inserted
+    try:
+        posts = bulk_posts_adapter.validate_json(await request.body())
+    except ValidationError as e:
+        raise validation_error(e)
+
+    for post in posts:
+        yield post
+
+
+async def read_ndjson_posts(request: Request):
+    # one post per line, validated as the body streams in
+    line_number = 0
+    async for line in read_lines(request):
+        line_number += 1
+        if not line.strip():
+            continue
+
+        try:
+            yield schemas.PostCreate.model_validate_json(line)
+        except ValidationError as e:
+            raise validation_error(e, line_number)
+
+
+async def read_bulk_posts(request: Request, chunk_size: int):
+    """Yield the posts of a bulk request in lists of at most `chunk_size`.
+
+    With an NDJSON body memory stays bounded by the chunk size, however many
+    posts are sent.
+    """
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        posts = read_ndjson_posts(request)
+    else:
+        posts = read_json_posts(request)
+
+    chunk = []
+    async for post in posts:
+        chunk.append(post)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def insert_posts(db: Session, posts: List[schemas.PostCreate], owner_id: int):
+    # one multi-row INSERT ... RETURNING id and one transaction per chunk
+    ids = db.scalars(
+        insert(models.Post).returning(models.Post.id, sort_by_parameter_order=True),
+        [{**post.model_dump(), "owner_id": owner_id} for post in posts],
+    ).all()
+    db.commit()
+    return ids
+
+
+def partial_bulk_response(e: RequestValidationError, ids: List[int]):
+    # earlier chunks are committed already; tell the client which ones
+    return serializers.response(
+        {"detail": jsonable_encoder(e.errors()), "ids": ids},
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+
+
+@router.post(
+    "/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=schemas.PostBulkOut,
+    openapi_extra=bulk_posts_openapi,
+)
+async def create_posts_bulk(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(oauth2.get_current_user),
+):
+    ids = []
+    try:
+        async for posts in read_bulk_posts(request, settings.bulk_chunk_size):
+            ids.extend(
+                await run_in_threadpool(insert_posts, db, posts, current_user.id)
+            )
+    except RequestValidationError as e:
+        if not ids:
+            raise
+        return partial_bulk_response(e, ids)
+    except IntegrityError:
+        await run_in_threadpool(db.rollback)
+        await run_in_threadpool(oauth2.check_user_exists, db)
+        raise
+
+    return serializers.response({"ids": ids}, status_code=status.HTTP_201_CREATED)
+
+
+# the ownership check is part of the WHERE clause, so the happy path is one
+# statement; only a write that matched nothing pays for the lookup below
+def delete_post_statement(id: int, owner_id: int):
+    return (
+        delete(models.Post)
+        .where(models.Post.id == id, models.Post.owner_id == owner_id)
+        .returning(models.Post.id)
+    )
+
+
+def update_post_statement(id: int, post: schemas.PostCreate, owner_id: int):
+    # selecting from the UPDATE brings the owner back in the same round trip
+    updated = (
+        update(models.Post)
+        .where(models.Post.id == id, models.Post.owner_id == owner_id)
+        .values(**post.model_dump(), version=models.Post.version + 1)
+        .returning(models.Post)
+        .cte("updated")
+    )
+    updated_post = aliased(models.Post, updated)
+
+    return (
+        select(updated_post, models.User)
+        .join(models.User, models.User.id == updated.c.owner_id)
+        .execution_options(populate_existing=True)
+    )
+
+
+def post_write_error(post: Optional[models.Post], id: int):
+    if post is None:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"post with id: {id} was not found",
+        )
+
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Not authorised to perform requested action",
+    )
 
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -109,23 +607,13 @@ def delete_post(
     # conn.commit()
 
     ## Using ORM - SQLAlchemy ##
-    post_query = db.query(models.Post).where(models.Post.id == id)
-    post = post_query.first()
+    deleted = db.scalar(delete_post_statement(id, current_user.id))
 
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"post with id: {id} was not found",
-        )
+    if deleted is None:
+        raise post_write_error(db.get(models.Post, id), id)
 
-    if post.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorised to perform requested action",
-        )
-
-    post_query.delete(synchronize_session=False)
     db.commit()
+    cache.invalidate(f"post:{id}")
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -149,22 +637,14 @@ def update_post(
     # conn.commit()
 
     ## Using ORM - SQLAlchemy ##
-    post_query = db.query(models.Post).where(models.Post.id == id)
-    updated_post = post_query.first()
-
-    if not updated_post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"post with id: {id} was not found",
-        )
+    updated = db.execute(update_post_statement(id, post, current_user.id)).first()
 
-    if updated_post.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorised to perform requested action",
-        )
+    if updated is None:
+        raise post_write_error(db.get(models.Post, id), id)
 
-    post_query.update(post.model_dump(), synchronize_session=False)
+    # serialize before the commit expires the row; the owner came back with it
+    content = serializers.post(updated[0])
     db.commit()
+    cache.invalidate(f"post:{id}")
 
-    return post_query.first()
+    return serializers.response(content)
@@ -1,18 +1,28 @@
+from typing import Optional
+
 from fastapi import APIRouter
 from fastapi import Depends
+from fastapi import Header
 from fastapi import HTTPException
 from fastapi import status
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 
 from .. import models
 from .. import schemas
+from .. import serializers
 from .. import utils
+from ..cache import cache
 from ..database import get_db
+from ..database import get_read_db
+from ..timing import TimedRoute
 
 
 router = APIRouter(
     prefix="/users",
     tags=["Users"],
+    default_response_class=ORJSONResponse,
+    route_class=TimedRoute,
 )
 
 
@@ -27,17 +37,35 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
-    return new_user
+    return serializers.response(
+        serializers.user_out(new_user), status_code=status.HTTP_201_CREATED
+    )
 
 
 @router.get("/{id}", response_model=schemas.UserOut)
-def get_user(id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == id).first()
+def get_user(
+    id: int,
+    db: Session = Depends(get_read_db),
+    if_none_match: Optional[str] = Header(None),
+):
+    key = f"user:{id}"
+    cached = cache.get(key)
+
+    if cached is None:
+        user = db.query(models.User).filter(models.User.id == id).first()
+
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"user with {id} does not exist",
+            )
+
+        etag = utils.user_etag(user.id, user.created_at)
+        cached = (etag, serializers.dumps(serializers.user_out(user)))
+        cache.set(key, cached, tags=[key])
 
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"user with {id} does not exist",
-        )
+    etag, body = cached
+    if utils.etag_matches(if_none_match, etag):
+        return serializers.not_modified(etag)
 
-    return user
+    return serializers.raw_response(body, headers={"ETag": etag})
@@ -1,42 +1,120 @@
+from typing import List
+
 from fastapi import APIRouter
+from fastapi import Body
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi import status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete
+from sqlalchemy import select
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from .. import models
 from .. import schemas
+from .. import serializers
+from ..cache import cache
+from ..config import settings
 from ..database import get_db
+from ..oauth2 import check_user_exists
 from ..oauth2 import get_current_user
+from ..timing import TimedRoute
+from ..vote_buffer import vote_buffer
 
 
 router = APIRouter(
     prefix="/vote",
     tags=["Votes"],
+    default_response_class=ORJSONResponse,
+    route_class=TimedRoute,
 )
 
 
+def add_votes_statement(user_id: int, post_ids):
+    """INSERT the votes and bump the counters of the posts that got one.
+
+    Votes that already exist are skipped by ON CONFLICT and return nothing, so
+    the statement returns the ids of exactly the posts whose vote was added.
+    A post that does not exist fails the foreign key with an IntegrityError.
+    """
+    new_votes = (
+        pg_insert(models.Vote)
+        .values([{"post_id": post_id, "user_id": user_id} for post_id in post_ids])
+        .on_conflict_do_nothing()
+        .returning(models.Vote.post_id)
+        .cte("new_votes")
+    )
+    return (
+        update(models.Post)
+        .where(models.Post.id == new_votes.c.post_id)
+        .values(
+            version=models.Post.version + 1,
+            votes_count=models.Post.votes_count + 1,
+            trending_score=models.trending_score(models.Post.votes_count + 1),
+        )
+        .returning(models.Post.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def remove_votes_statement(user_id: int, post_ids):
+    """DELETE the votes and decrement the counters of the posts that lost one."""
+    old_votes = (
+        delete(models.Vote)
+        .where(models.Vote.user_id == user_id, models.Vote.post_id.in_(post_ids))
+        .returning(models.Vote.post_id)
+        .cte("old_votes")
+    )
+    return (
+        update(models.Post)
+        .where(models.Post.id == old_votes.c.post_id)
+        .values(
+            version=models.Post.version + 1,
+            votes_count=models.Post.votes_count - 1,
+            trending_score=models.trending_score(models.Post.votes_count - 1),
+        )
+        .returning(models.Post.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def post_not_found(post_id: int):
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Post with {post_id} does not exist",
+    )
+
+
 @router.post("/", status_code=status.HTTP_201_CREATED)
 def vote(
     vote: schemas.Vote,
     db: Session = Depends(get_db),
     current_user: int = Depends(get_current_user),
 ):
-    post = db.query(models.Post).where(models.Post.id == vote.post_id).first()
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Post with {vote.post_id} does not exist",
-        )
+    # a single statement per direction: no check-then-write race, and the
+    # foreign key rather than a lookup tells us about missing posts
+    if settings.vote_buffer:
+        if not db.get(models.Post, vote.post_id):
+            raise post_not_found(vote.post_id)
 
-    vote_query = db.query(models.Vote).where(
-        models.Vote.post_id == vote.post_id, models.Vote.user_id == current_user.id
-    )
+        vote_buffer.add(vote.post_id, current_user.id, vote.dir)
 
-    found_vote = vote_query.first()
+        return serializers.response(
+            {"message": "vote accepted"}, status_code=status.HTTP_202_ACCEPTED
+        )
 
     if vote.dir == 1:
-        if found_vote:
+        try:
+            added = db.scalar(add_votes_statement(current_user.id, [vote.post_id]))
+        except IntegrityError:
+            db.rollback()
+            check_user_exists(db)
+            raise post_not_found(vote.post_id)
+
+        if not added:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail=(
@@ -45,21 +123,120 @@ def vote(
                 ),
             )
 
-        new_vote = models.Vote(
-            post_id=vote.post_id,
-            user_id=current_user.id,
-        )
-        db.add(new_vote)
         db.commit()
+        cache.invalidate(f"post:{vote.post_id}")
 
         return {"message": "successfully added vote"}
     else:
-        if not found_vote:
+        removed = db.scalar(remove_votes_statement(current_user.id, [vote.post_id]))
+
+        if not removed:
+            # nothing was deleted; only now find out which 404 it is
+            if not db.get(models.Post, vote.post_id):
+                raise post_not_found(vote.post_id)
+
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Vote does not exist"
             )
 
-        vote_query.delete(synchronize_session=False)
         db.commit()
+        cache.invalidate(f"post:{vote.post_id}")
 
         return {"message": "successfully deleted vote"}
+
+
+def plan_votes(votes: List[schemas.Vote], post_ids, voted_post_ids, email):
+    """Replay `votes` in order against the posts that exist and the posts the
+    user has voted on, with the same outcomes as one `vote` call per item.
+
+    Returns the per-item results and the post ids whose vote row has to be
+    inserted or deleted once the whole batch is applied.
+    """
+    voted = set(voted_post_ids)
+    results = []
+
+    for vote in votes:
+        if vote.post_id not in post_ids:
+            status_code = status.HTTP_404_NOT_FOUND
+            detail = f"Post with {vote.post_id} does not exist"
+        elif vote.dir == 1 and vote.post_id in voted:
+            status_code = status.HTTP_409_CONFLICT
+            detail = f"User {email} has already voted on post {vote.post_id}"
+        elif vote.dir == 1:
+            voted.add(vote.post_id)
+            status_code = status.HTTP_201_CREATED
+            detail = "successfully added vote"
+        elif vote.post_id not in voted:
+            status_code = status.HTTP_404_NOT_FOUND
+            detail = "Vote does not exist"
+        else:
+            voted.discard(vote.post_id)
+            status_code = status.HTTP_201_CREATED
+            detail = "successfully deleted vote"
+
+        results.append(
+            {
+                "post_id": vote.post_id,
+                "dir": vote.dir,
+                "status_code": status_code,
+                "detail": detail,
+            }
+        )
+
+    return results, voted - voted_post_ids, voted_post_ids - voted
+
+
+def apply_votes_statements(user_id: int, to_insert, to_delete):
+    """Set-based statements that apply a planned batch, counters included."""
+    statements = []
+
+    if to_insert:
+        statements.append(add_votes_statement(user_id, to_insert))
+
+    if to_delete:
+        statements.append(remove_votes_statement(user_id, to_delete))
+
+    return statements
+
+
+@router.post("/batch", response_model=List[schemas.VoteResult])
+def vote_batch(
+    votes: List[schemas.Vote] = Body(max_length=settings.vote_batch_max_size),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(get_current_user),
+):
+    requested = {vote.post_id for vote in votes}
+
+    # one query for the posts that exist, one for the user's existing votes
+    post_ids = set(
+        db.scalars(select(models.Post.id).where(models.Post.id.in_(requested)))
+    )
+    voted_post_ids = set(
+        db.scalars(
+            select(models.Vote.post_id).where(
+                models.Vote.user_id == current_user.id,
+                models.Vote.post_id.in_(requested),
+            )
+        )
+    )
+
+    results, to_insert, to_delete = plan_votes(
+        votes, post_ids, voted_post_ids, current_user.email
+    )
+
+    try:
+        for statement in apply_votes_statements(current_user.id, to_insert, to_delete):
+            db.execute(statement)
+        db.commit()
+    except IntegrityError:
+        # a post deleted since it was looked up
+        db.rollback()
+        check_user_exists(db)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="A post of the batch no longer exists",
+        )
+
+    cache.invalidate(*(f"post:{post_id}" for post_id in to_insert | to_delete))
+
+    return serializers.response(results)
@@ -1,4 +1,6 @@
 from datetime import datetime
+from typing import List
+from typing import Optional
 
 from pydantic import BaseModel
 from pydantic import EmailStr
@@ -52,6 +54,10 @@ class PostOut(BaseModel):
         from_attributes = True
 
 
+class PostBulkOut(BaseModel):
+    ids: List[int]
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -59,8 +65,17 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     id: int
+    email: Optional[str] = None
+    version: Optional[int] = None
 
 
 class Vote(BaseModel):
     post_id: int
     dir: int = Field(ge=0, le=1)
+
+
+class VoteResult(BaseModel):
+    post_id: int
+    dir: int
+    status_code: int
+    detail: str
@@ -0,0 +1,82 @@
+"""Plain-dict serializers for the hot response paths.
+
+The ORM rows handed to these functions were just read from the database, so
+running them through pydantic validation again buys nothing. The dicts built
+here mirror `schemas.UserOut`, `schemas.Post` and `schemas.PostOut` field for
+field and are rendered by orjson; the schemas remain the documented
+`response_model` of each route.
+"""
+import orjson
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+
+from .timing import measure
+
+
+def user_out(user):
+    return {
+        "id": user.id,
+        "email": user.email,
+        "created_at": user.created_at,
+    }
+
+
+def post(post):
+    return {
+        "title": post.title,
+        "content": post.content,
+        "published": post.published,
+        "id": post.id,
+        "created_at": post.created_at,
+        "owner_id": post.owner_id,
+        "owner": user_out(post.owner),
+    }
+
+
+def post_out(row):
+    return {"Post": post(row.Post), "votes": row.votes}
+
+
+def posts_out(rows):
+    return [post_out(row) for row in rows]
+
+
+def sparse_post_out(row, fields):
+    # `row` comes from `select_sparse_posts`, with only `fields` read
+    post = {}
+    for name in fields:
+        if name == "owner":
+            post["owner"] = {
+                "id": row.owner_id,
+                "email": row.owner_email,
+                "created_at": row.owner_created_at,
+            }
+        else:
+            post[name] = getattr(row, name)
+    return {"Post": post, "votes": row.votes}
+
+
+def sparse_posts_out(rows, fields):
+    return [sparse_post_out(row, fields) for row in rows]
+
+
+def response(content, status_code=200, headers=None):
+    # returning a Response makes FastAPI skip its own response_model pass
+    with measure("serialize"):
+        return ORJSONResponse(content, status_code=status_code, headers=headers)
+
+
+def dumps(content) -> bytes:
+    with measure("serialize"):
+        return orjson.dumps(content)
+
+
+def raw_response(body: bytes, status_code=200, headers=None):
+    # `body` is JSON that was rendered earlier, e.g. by `dumps` for the cache
+    return Response(
+        body, status_code=status_code, headers=headers, media_type="application/json"
+    )
+
+
+def not_modified(etag: str, headers=None):
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag})
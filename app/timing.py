@@ -0,0 +1,159 @@
+"""Per-request timing, reported as a Server-Timing header and a log record.
+
+`TimingMiddleware` opens a `RequestTimings` for every HTTP request and keeps
+it in a context variable. Code running on behalf of the request adds to it
+through `record` / `measure`:
+
+- `db`: SQL execution, from the engine hooks installed by
+  `database.instrument_engine`, with the statement count;
+- `pool`: time spent waiting for a pooled connection;
+- `auth`: `get_current_user`, including its own queries;
+- `serialize`: rendering JSON in `app.serializers`;
+- `handler`: the endpoint function itself, for routers built with
+  `route_class=TimedRoute`; dependencies such as `auth` run before it, and a
+  streamed body is sent after it returns;
+- `app`: everything from the request arriving to the response starting,
+  middleware and dependencies included.
+
+Segments overlap, e.g. `db` covers the queries made during `auth`.
+Threadpool handlers see the same context, because Starlette copies it into
+the worker thread and the `RequestTimings` object itself is shared.
+"""
+import asyncio
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from fastapi.routing import APIRoute
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        # name -> [count, seconds]
+        self.segments: Dict[str, List[float]] = {}
+
+    def record(self, name: str, seconds: float):
+        segment = self.segments.setdefault(name, [0, 0.0])
+        segment[0] += 1
+        segment[1] += seconds
+
+    def server_timing(self) -> str:
+        metrics = []
+        for name, (count, seconds) in self.segments.items():
+            metric = f"{name};dur={seconds * 1000:.1f}"
+            if name == "db":
+                metric += f';desc="{count} queries"'
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+    def log_fields(self) -> Dict[str, float]:
+        fields = {}
+        for name, (_, seconds) in self.segments.items():
+            fields[f"{name}_ms"] = round(seconds * 1000, 3)
+        fields["db_queries"] = int(self.segments.get("db", [0])[0])
+        return fields
+
+
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def record(name: str, seconds: float):
+    # outside of a request, e.g. in the vote buffer's flusher, this is a no-op
+    timings = request_timings.get()
+    if timings is not None:
+        timings.record(name, seconds)
+
+
+@contextmanager
+def measure(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed_endpoint(endpoint):
+    """Wrap `endpoint` so that its run time is recorded as `handler`."""
+    # include_router builds each route again, with the already wrapped endpoint
+    if getattr(endpoint, "timed", False):
+        return endpoint
+
+    # the signature is read through `__wrapped__`, so dependencies still resolve
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def timed(*args, **kwargs):
+            with measure("handler"):
+                return await endpoint(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(endpoint)
+        def timed(*args, **kwargs):
+            with measure("handler"):
+                return endpoint(*args, **kwargs)
+
+    timed.timed = True
+    return timed
+
+
+class TimedRoute(APIRoute):
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, timed_endpoint(endpoint), **kwargs)
+
+
+class TimingMiddleware:
+    """Pure ASGI middleware, so streamed bodies are not buffered."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        status_code = 500
+
+        async def send_with_timings(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                timings.record("app", time.perf_counter() - timings.start)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            request_timings.reset(token)
+            logger.info(
+                "%s %s %s",
+                scope["method"],
+                scope["path"],
+                status_code,
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status_code": status_code,
+                    "duration_ms": round(
+                        (time.perf_counter() - timings.start) * 1000, 3
+                    ),
+                    **timings.log_fields(),
+                },
+            )
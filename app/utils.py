@@ -1,12 +1,159 @@
+import asyncio
+import base64
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+
+from fastapi import HTTPException
+from fastapi import status
 from passlib.context import CryptContext
 
+from .config import settings
+from .metrics import password_hash_duration
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# min/max pin the cost, so hashes made with any other cost need an update
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds,
+)
 
-def hash(password: str):
+hash_workers = settings.hash_workers or os.cpu_count() or 1
+
+# bcrypt pins a core for a few hundred ms, so it runs in worker processes
+# rather than on threads that share the GIL with the rest of the app; the
+# pool is created on first use so that every gunicorn worker owns its own
+hash_executor: Optional[ProcessPoolExecutor] = None
+hash_executor_lock = threading.Lock()
+hash_slots = threading.BoundedSemaphore(hash_workers + settings.hash_queue_size)
+
+
+def get_hash_executor():
+    global hash_executor
+    with hash_executor_lock:
+        if hash_executor is None:
+            hash_executor = ProcessPoolExecutor(
+                max_workers=hash_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return hash_executor
+
+
+def submit_hash_job(fn, *args) -> Future:
+    # shed load instead of queueing without bound behind a login storm
+    if not hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password hashing requests, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    try:
+        future = get_hash_executor().submit(fn, *args)
+    except BaseException:
+        hash_slots.release()
+        raise
+
+    start = time.perf_counter()
+
+    def done(_):
+        hash_slots.release()
+        password_hash_duration.labels(fn.__name__).observe(time.perf_counter() - start)
+
+    future.add_done_callback(done)
+    return future
+
+
+# executed inside the pool's worker processes
+def hash_password(password: str):
     return pwd_context.hash(password)
 
 
+def verify_password(plain_password: str, hashed_password: str):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def hash(password: str):
+    return submit_hash_job(hash_password, password).result()
+
+
 def verify(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+    return verify_and_update(plain_password, hashed_password)[0]
+
+
+def verify_and_update(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """Return whether the password matches and, if its hash was made with an
+    outdated cost, a replacement hash to store."""
+    return submit_hash_job(verify_password, plain_password, hashed_password).result()
+
+
+async def hash_async(password: str):
+    return await asyncio.wrap_future(submit_hash_job(hash_password, password))
+
+
+async def verify_and_update_async(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    return await asyncio.wrap_future(
+        submit_hash_job(verify_password, plain_password, hashed_password)
+    )
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = f"{created_at.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    # raises ValueError on anything that was not produced by `encode_cursor`
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    created_at, id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(created_at), int(id)
+
+
+# strong ETags: equal tags mean byte-identical responses, because every
+# change a response shows bumps the row's `version` (users never change)
+def post_etag(id: int, version: int) -> str:
+    return f'"post-{id}-{version}"'
+
+
+def page_etag(
+    keys: Iterable[Tuple[int, int]], fields: Optional[Iterable[str]] = None
+) -> str:
+    # the (id, version) of each row on the page, in order; a sparse page is
+    # a different representation of the same rows, so its fields count too
+    digest = hashlib.sha1(usedforsecurity=False)
+    if fields is not None:
+        digest.update(f"{','.join(fields)};".encode())
+    for id, version in keys:
+        digest.update(f"{id}:{version},".encode())
+    return f'"posts-{digest.hexdigest()}"'
+
+
+def user_etag(id: int, created_at: datetime) -> str:
+    return f'"user-{id}-{int(created_at.timestamp() * 1_000_000)}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match uses the weak comparison, so a W/ prefix is ignored
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
@@ -0,0 +1,243 @@
+"""Write-behind buffer for votes (`VOTE_BUFFER=true`).
+
+A popular post gets thousands of votes within seconds, and committing each
+one on its own makes every request queue for the lock on the same `posts`
+row. In write-behind mode `POST /vote/` only checks that the post exists,
+records the vote here and answers 202. A background thread then writes the
+buffer out in one transaction of two set-based statements. Each post's
+counter moves once per flush rather than once per vote.
+
+Only the latest direction per (post_id, user_id) is kept, so a vote that is
+toggled on and off between flushes costs nothing. A flush is triggered when
+`vote_buffer_flush_size` votes are pending or every
+`vote_buffer_flush_seconds`, whichever comes first. Shutdown flushes through
+the app lifespan.
+
+Losses are bounded. If the process dies without a clean shutdown, at most
+the votes of the last interval are lost, and never more than
+`vote_buffer_max_pending`. A flush that fails puts its votes back, and once
+that many votes are waiting new ones are refused with a 503 rather than held
+without limit. The votes put back are held to the same limit: those that no
+longer fit are dropped, logged and counted in `dropped`.
+
+Every gunicorn worker has its own buffer. Duplicate votes therefore cannot be
+detected when they are accepted, and are answered 202 rather than 409.
+"""
+import logging
+import threading
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from fastapi import HTTPException
+from fastapi import status
+from sqlalchemy import column
+from sqlalchemy import delete
+from sqlalchemy import func
+from sqlalchemy import Integer
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy import update
+from sqlalchemy import values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from . import models
+from .cache import cache
+from .config import settings
+from .database import SessionLocal
+
+
+logger = logging.getLogger(__name__)
+
+
+def count_by_post(changed_votes):
+    return (
+        select(changed_votes.c.post_id, func.count().label("n"))
+        .group_by(changed_votes.c.post_id)
+        .cte(f"{changed_votes.name}_per_post")
+    )
+
+
+def add_vote_pairs_statement(pairs):
+    """INSERT (post_id, user_id) votes and add the new ones to the counters.
+
+    Pairs whose post or user has been deleted since they were accepted are
+    dropped by the joins instead of failing the whole flush on a foreign key.
+    """
+    pending = values(
+        column("post_id", Integer), column("user_id", Integer), name="pending"
+    ).data(pairs)
+    new_votes = (
+        pg_insert(models.Vote)
+        .from_select(
+            ["post_id", "user_id"],
+            select(pending.c.post_id, pending.c.user_id)
+            .join(models.Post, models.Post.id == pending.c.post_id)
+            .join(models.User, models.User.id == pending.c.user_id),
+        )
+        .on_conflict_do_nothing()
+        .returning(models.Vote.post_id)
+        .cte("new_votes")
+    )
+    counts = count_by_post(new_votes)
+    return (
+        update(models.Post)
+        .where(models.Post.id == counts.c.post_id)
+        .values(
+            version=models.Post.version + 1,
+            votes_count=models.Post.votes_count + counts.c.n,
+            trending_score=models.trending_score(models.Post.votes_count + counts.c.n),
+        )
+        .returning(models.Post.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def remove_vote_pairs_statement(pairs):
+    """DELETE (post_id, user_id) votes and take them off the counters."""
+    old_votes = (
+        delete(models.Vote)
+        .where(tuple_(models.Vote.post_id, models.Vote.user_id).in_(pairs))
+        .returning(models.Vote.post_id)
+        .cte("old_votes")
+    )
+    counts = count_by_post(old_votes)
+    return (
+        update(models.Post)
+        .where(models.Post.id == counts.c.post_id)
+        .values(
+            version=models.Post.version + 1,
+            votes_count=models.Post.votes_count - counts.c.n,
+            trending_score=models.trending_score(models.Post.votes_count - counts.c.n),
+        )
+        .returning(models.Post.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+class VoteBuffer:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        flush_size: int = settings.vote_buffer_flush_size,
+        flush_seconds: float = settings.vote_buffer_flush_seconds,
+        max_pending: int = settings.vote_buffer_max_pending,
+    ):
+        self.session_factory = session_factory
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.pending: Dict[Tuple[int, int], int] = {}
+        self.lock = threading.Lock()
+        # serialises flushes, so a put-back batch cannot overtake a newer one
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.flushed = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def add(self, post_id: int, user_id: int, dir: int):
+        with self.lock:
+            if (post_id, user_id) not in self.pending:
+                if len(self.pending) >= self.max_pending:
+                    raise HTTPException(
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail="Too many pending votes, try again shortly",
+                        headers={"Retry-After": "1"},
+                    )
+            self.pending[(post_id, user_id)] = dir
+            full = len(self.pending) >= self.flush_size
+
+        self.start()
+        if full:
+            self.wakeup.set()
+
+    def start(self):
+        # started on first use, so that every gunicorn worker runs its own
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(
+                        target=self.run, name="vote-buffer", daemon=True
+                    )
+                    self.thread.start()
+
+    def run(self):
+        while not self.closed.is_set():
+            self.wakeup.wait(self.flush_seconds)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("vote buffer flush failed, retrying")
+
+    def flush(self) -> int:
+        """Write out the pending votes in one transaction; returns their count."""
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+
+            if not batch:
+                return 0
+
+            added = [pair for pair, dir in batch.items() if dir == 1]
+            removed = [pair for pair, dir in batch.items() if dir == 0]
+
+            try:
+                with self.session_factory() as db:
+                    if added:
+                        db.execute(add_vote_pairs_statement(added))
+                    if removed:
+                        db.execute(remove_vote_pairs_statement(removed))
+                    db.commit()
+            except Exception:
+                self.failures += 1
+                self.put_back(batch)
+                raise
+
+            self.flushed += len(batch)
+            cache.invalidate(*{f"post:{post_id}" for post_id, _ in batch})
+
+            return len(batch)
+
+    def put_back(self, batch: Dict[Tuple[int, int], int]):
+        # the batch comes back under the rule of `add`: a vote that is not
+        # pending only gets a place while there is room. There is no one left
+        # to answer 503 to, so a vote that does not fit is dropped.
+        dropped = 0
+        with self.lock:
+            for pair, dir in batch.items():
+                if pair in self.pending:
+                    # accepted while the flush ran, so newer
+                    continue
+                if len(self.pending) >= self.max_pending:
+                    dropped += 1
+                    continue
+                self.pending[pair] = dir
+            self.dropped += dropped
+
+        if dropped:
+            logger.warning(
+                "vote buffer full, dropped %d votes of a failed flush", dropped
+            )
+
+    def close(self):
+        """Stop the flusher thread and write out what is left."""
+        self.closed.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+vote_buffer = VoteBuffer()
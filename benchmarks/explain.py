@@ -0,0 +1,214 @@
+"""Audit the query plans of the routers for sequential scans.
+
+    python -m benchmarks.seed --reset
+    python -m benchmarks.explain
+
+Every statement is built by the helpers the routers themselves use, so a
+change to a query is audited with it. Each one is planned with EXPLAIN
+against the seeded database. A Seq Scan of a table a query has not been
+allowed to scan is reported, and the exit status is then 1. EXPLAIN without
+ANALYZE never runs the statement, so the writes are planned but not applied.
+
+On a nearly empty database a Seq Scan is the cheapest plan for everything.
+Seed realistic volumes first.
+"""
+import argparse
+import json
+import sys
+from collections import namedtuple
+from datetime import datetime
+from datetime import timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy import select
+
+from app import export
+from app import models
+from app import schemas
+from app import utils
+from app.database import SQLALCHEMY_DATABASE_URL
+from app.routers.aio.post import select_posts
+from app.routers.post import delete_post_statement
+from app.routers.post import filter_posts
+from app.routers.post import order_top_posts
+from app.routers.post import select_sparse_posts
+from app.routers.post import summary_fields
+from app.routers.post import update_post_statement
+from app.routers.vote import add_votes_statement
+from app.routers.vote import remove_votes_statement
+from app.vote_buffer import add_vote_pairs_statement
+from app.vote_buffer import remove_vote_pairs_statement
+
+
+# `seq_scans` are the tables the query is expected to read in full
+Query = namedtuple("Query", ["name", "statement", "seq_scans"])
+
+
+def listing(search="", sort="recent", cursor=None, skip=0, query=None):
+    query, _ = filter_posts(
+        select_posts() if query is None else query, search, True, sort, cursor, skip
+    )
+    return query.limit(10)
+
+
+def queries(sample):
+    user_id, email, post_id, post_ids = (
+        sample["user_id"],
+        sample["email"],
+        sample["post_id"],
+        sample["post_ids"],
+    )
+    cursor = utils.encode_cursor(datetime.now(timezone.utc), post_id)
+    post = schemas.PostCreate(title="explain", content="explain")
+
+    return [
+        Query(
+            "current user",
+            select(models.User).where(models.User.id == user_id),
+            (),
+        ),
+        Query("POST /login", select(models.User).where(models.User.email == email), ()),
+        Query("GET /posts/", listing(), ()),
+        Query("GET /posts/?cursor", listing(cursor=cursor), ()),
+        Query("GET /posts/?skip", listing(skip=50_000), ()),
+        Query("GET /posts/?search", listing(search="postgres indexes"), ()),
+        # ranking reads every match before the LIMIT, and the planner may
+        # hash-join all the owners for them
+        Query(
+            "GET /posts/?sort=relevance",
+            listing(search="postgres indexes", sort="relevance"),
+            ("users",),
+        ),
+        Query(
+            "GET /posts/?view=summary",
+            listing(query=select_sparse_posts(list(summary_fields))),
+            (),
+        ),
+        Query(
+            "GET /posts/ If-None-Match",
+            listing(query=select(models.Post.id, models.Post.version)),
+            (),
+        ),
+        Query(
+            "GET /posts/top",
+            order_top_posts(select_posts(), "votes").limit(10),
+            (),
+        ),
+        Query(
+            "GET /posts/top?order=trending",
+            order_top_posts(select_posts(), "trending").limit(10),
+            (),
+        ),
+        Query(
+            "GET /posts/{id}",
+            select_posts().where(models.Post.id == post_id),
+            (),
+        ),
+        Query(
+            "GET /posts/{id} If-None-Match",
+            select(models.Post.version).where(models.Post.id == post_id),
+            (),
+        ),
+        # a dump of the whole table
+        Query("GET /posts/export", export.export_query(), ("posts",)),
+        Query("PUT /posts/{id}", update_post_statement(post_id, post, user_id), ()),
+        Query("DELETE /posts/{id}", delete_post_statement(post_id, user_id), ()),
+        Query("POST /vote/ dir=1", add_votes_statement(user_id, [post_id]), ()),
+        Query("POST /vote/ dir=0", remove_votes_statement(user_id, [post_id]), ()),
+        Query(
+            "POST /vote/batch votes",
+            select(models.Vote.post_id).where(
+                models.Vote.user_id == user_id, models.Vote.post_id.in_(post_ids)
+            ),
+            (),
+        ),
+        Query(
+            "vote buffer add",
+            add_vote_pairs_statement([(id, user_id) for id in post_ids]),
+            (),
+        ),
+        Query(
+            "vote buffer remove",
+            remove_vote_pairs_statement([(id, user_id) for id in post_ids]),
+            (),
+        ),
+        Query(
+            "votes of a user",
+            select(models.Vote.post_id).where(models.Vote.user_id == user_id),
+            (),
+        ),
+        Query(
+            "posts of a user",
+            select(models.Post.id).where(models.Post.owner_id == user_id),
+            (),
+        ),
+    ]
+
+
+def load_sample(connection):
+    user = connection.execute(
+        select(models.User.id, models.User.email).order_by(models.User.id).limit(1)
+    ).first()
+    if user is None:
+        raise SystemExit("the database is empty; run `python -m benchmarks.seed`")
+
+    post_ids = connection.scalars(
+        select(models.Post.id).order_by(models.Post.id).limit(10)
+    ).all()
+    return {
+        "user_id": user.id,
+        "email": user.email,
+        "post_id": post_ids[0],
+        "post_ids": post_ids,
+    }
+
+
+def plan(connection, statement):
+    compiled = statement.compile(
+        dialect=connection.dialect, compile_kwargs={"render_postcompile": True}
+    )
+    return connection.exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+    ).scalar()[0]["Plan"]
+
+
+def seq_scans(node):
+    """The relations read by Seq Scan nodes anywhere under `node`."""
+    scanned = set()
+    if node["Node Type"] == "Seq Scan":
+        scanned.add(node["Relation Name"])
+    for child in node.get("Plans", ()):
+        scanned |= seq_scans(child)
+    return scanned
+
+
+def audit(connection):
+    """Plan every query; returns {name: (top plan node, unexpected seq scans)}."""
+    results = {}
+    for query in queries(load_sample(connection)):
+        top = plan(connection, query.statement)
+        results[query.name] = (top, seq_scans(top).difference(query.seq_scans))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    with create_engine(args.database_url).connect() as connection:
+        results = audit(connection)
+
+    for name, (top, flagged) in results.items():
+        verdict = f"SEQ SCAN {', '.join(sorted(flagged))}" if flagged else "ok"
+        print(f"{name:<32}{top['Total Cost']:>12.2f}  {verdict}")
+        if args.verbose:
+            print(json.dumps(top, indent=2))
+
+    if any(flagged for _, flagged in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
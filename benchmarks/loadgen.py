@@ -0,0 +1,265 @@
+"""Closed-loop load generator for a running API.
+
+    python -m benchmarks.loadgen --base-url http://localhost:8000 \\
+        --users 50 --duration 60 --mix list=60,get=25,create=5,vote=8,login=2
+
+Every virtual user logs in once through /login and then sends one request
+at a time, chosen at random with the weights of `--mix`, until `--duration`
+is up. `--users` therefore sets the concurrency. `--rps` additionally caps
+the combined request rate of all users, so a fixed load can be offered
+instead of as much as the server can take.
+
+The users are the ones created by `python -m benchmarks.seed`
+(user1@example.com ... with password `password`). Pass `--signup` to
+register fresh ones through POST /users/ first. The report has throughput,
+p50/p95/p99 latency and 4xx/error counts per route. Errors are 5xx
+responses and failed connections; 4xx responses, such as a 409 for a
+repeated vote, are expected under a random mix and counted apart.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import httpx
+
+
+# the password of every user made by benchmarks.seed
+PASSWORD = "password"
+
+
+class Pacer:
+    """Hand out request slots no faster than `rps` across all users."""
+
+    def __init__(self, rps: Optional[float]):
+        self.interval = 1 / rps if rps else 0
+        self.next_slot = time.perf_counter()
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.perf_counter()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.client_errors: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, route: str, seconds: float, status_code: Optional[int]):
+        self.latencies[route].append(seconds)
+        if status_code is None or status_code >= 500:
+            self.errors[route] += 1
+        elif status_code >= 400:
+            self.client_errors[route] += 1
+
+    def report(self, elapsed: float):
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            cuts = (
+                statistics.quantiles(latencies, n=100, method="inclusive")
+                if len(latencies) > 1
+                else latencies * 99
+            )
+            routes[route] = {
+                "requests": len(latencies),
+                "rps": round(len(latencies) / elapsed, 1),
+                "p50_ms": round(cuts[49] * 1000, 1),
+                "p95_ms": round(cuts[94] * 1000, 1),
+                "p99_ms": round(cuts[98] * 1000, 1),
+                "4xx": self.client_errors[route],
+                "errors": self.errors[route],
+            }
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            "elapsed_seconds": round(elapsed, 1),
+            "requests": total,
+            "rps": round(total / elapsed, 1),
+            "error_rate": round(sum(self.errors.values()) / max(total, 1), 4),
+            "routes": routes,
+        }
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, email: str):
+        self.client = client
+        self.stats = stats
+        self.email = email
+        self.headers = {}
+        # ids seen in listings, for the get and vote calls
+        self.post_ids: List[int] = []
+
+    async def request(self, route: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            res = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.stats.record(route, time.perf_counter() - start, None)
+            return None
+        self.stats.record(route, time.perf_counter() - start, res.status_code)
+        return res
+
+    async def signup(self):
+        await self.request(
+            "POST /users/",
+            "POST",
+            "/users/",
+            json={"email": self.email, "password": PASSWORD},
+        )
+
+    async def login(self):
+        res = await self.request(
+            "POST /login",
+            "POST",
+            "/login",
+            data={"username": self.email, "password": PASSWORD},
+        )
+        if res is not None and res.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+        return res
+
+    async def list(self):
+        res = await self.request(
+            "GET /posts/", "GET", "/posts/", params={"limit": 10}, headers=self.headers
+        )
+        if res is not None and res.status_code == 200:
+            self.post_ids = [post["Post"]["id"] for post in res.json()] or self.post_ids
+
+    async def get(self):
+        if not self.post_ids:
+            return await self.list()
+        await self.request(
+            "GET /posts/{id}",
+            "GET",
+            f"/posts/{random.choice(self.post_ids)}",  # noqa: S311
+            headers=self.headers,
+        )
+
+    async def create(self):
+        await self.request(
+            "POST /posts/",
+            "POST",
+            "/posts/",
+            json={"title": "load test", "content": f"posted by {self.email}"},
+            headers=self.headers,
+        )
+
+    async def vote(self):
+        if not self.post_ids:
+            return await self.list()
+        await self.request(
+            "POST /vote/",
+            "POST",
+            "/vote/",
+            json={
+                "post_id": random.choice(self.post_ids),  # noqa: S311
+                "dir": random.randint(0, 1),  # noqa: S311
+            },
+            headers=self.headers,
+        )
+
+    async def run(self, mix: Dict[str, float], pacer: Pacer, deadline: float):
+        operations = [getattr(self, name) for name in mix]
+        weights = list(mix.values())
+        while time.perf_counter() < deadline:
+            await pacer.wait()
+            await random.choices(operations, weights)[0]()  # noqa: S311
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("list", "get", "create", "vote", "login"):
+            raise argparse.ArgumentTypeError(f"unknown operation: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def run(args):
+    stats = Stats()
+    pacer = Pacer(args.rps)
+    limits = httpx.Limits(
+        max_connections=args.users, max_keepalive_connections=args.users
+    )
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=args.timeout
+    ) as client:
+        run_id = uuid.uuid4().hex[:8]
+        users = [
+            VirtualUser(
+                client,
+                stats,
+                f"loadgen-{run_id}-{i}@example.com"
+                if args.signup
+                else f"user{args.first_user + i}@example.com",
+            )
+            for i in range(args.users)
+        ]
+
+        if args.signup:
+            await asyncio.gather(*(user.signup() for user in users))
+        await asyncio.gather(*(user.login() for user in users))
+        # the warm-up logins are not part of the measurement
+        stats = Stats()
+        for user in users:
+            user.stats = stats
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(user.run(args.mix, pacer, start + args.duration) for user in users)
+        )
+        return stats.report(time.perf_counter() - start)
+
+
+def print_report(report):
+    print(
+        f"{report['requests']} requests in {report['elapsed_seconds']}s: "
+        f"{report['rps']} req/s, error rate {report['error_rate']:.2%}"
+    )
+    columns = ["requests", "rps", "p50_ms", "p95_ms", "p99_ms", "4xx", "errors"]
+    print(f"{'route':<20}" + "".join(f"{column:>10}" for column in columns))
+    for route, row in report["routes"].items():
+        print(f"{route:<20}" + "".join(f"{row[column]:>10}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=10, help="concurrency")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--rps", type=float, help="cap on the total request rate")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix("list=60,get=25,create=5,vote=8,login=2"),
+    )
+    parser.add_argument("--signup", action="store_true")
+    parser.add_argument("--first-user", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Fill a database with realistic volumes of users, posts and votes.
+
+    python -m benchmarks.seed --users 5000 --posts 100000 --votes 1000000
+
+Rows are generated by `generate_series` inside the server, so a million
+votes take seconds rather than a million round trips. Every user's password
+is `password`; a single bcrypt hash is shared because hashing thousands of
+them would dominate the run. Run against an empty schema (`alembic upgrade
+head`) or pass `--reset` to truncate the tables first.
+"""
+import argparse
+
+from sqlalchemy import create_engine
+from sqlalchemy import text
+
+from app import utils
+from app.database import SQLALCHEMY_DATABASE_URL
+
+
+PASSWORD = "password"
+
+
+def seed(connection, users=5000, posts=100_000, votes=1_000_000, reset=False):
+    # vote i goes to post i % posts from user (i / posts + 7 * post) % users:
+    # for a given post the users differ as long as votes <= users * posts
+    if votes > users * posts:
+        raise ValueError("cannot place more votes than users * posts")
+
+    if reset:
+        connection.execute(
+            text("TRUNCATE votes, posts, users RESTART IDENTITY CASCADE")
+        )
+
+    params = {
+        "users": users,
+        "posts": posts,
+        "votes": votes,
+        "password": utils.hash_password(PASSWORD),
+    }
+
+    connection.execute(
+        text(
+            """
+            INSERT INTO users (email, password, created_at)
+            SELECT 'user' || i || '@example.com', :password,
+                   now() - make_interval(secs => :users - i)
+            FROM generate_series(1, :users) AS i
+            """
+        ),
+        params,
+    )
+    # posts are spread over the users and over the last `posts` minutes; the
+    # trending_score default is the time of the INSERT, so it is set from the
+    # backdated created_at instead, here for no votes and with the counts below
+    connection.execute(
+        text(
+            """
+            INSERT INTO posts
+                (title, content, published, owner_id, created_at, trending_score)
+            SELECT 'Post ' || i || ' about ' || (ARRAY['fastapi', 'postgres',
+                       'python', 'caching', 'indexes', 'asyncio'])[1 + i % 6],
+                   repeat('Lorem ipsum dolor sit amet, consectetur. ', 1 + i % 8)
+                       || 'Number ' || i || '.',
+                   i % 10 <> 0,
+                   (SELECT min(id) FROM users) + i % :users,
+                   created_at,
+                   extract(epoch from created_at) / 45000
+            FROM generate_series(1, :posts) AS i,
+                 LATERAL (SELECT now() - make_interval(mins => :posts - i)
+                          AS created_at) AS backdated
+            """
+        ),
+        params,
+    )
+    connection.execute(
+        text(
+            """
+            INSERT INTO votes (post_id, user_id)
+            SELECT (SELECT min(id) FROM posts) + i % :posts,
+                   (SELECT min(id) FROM users) + (i / :posts + 7 * (i % :posts)) % :users
+            FROM generate_series(0, :votes - 1) AS i
+            """
+        ),
+        params,
+    )
+    connection.execute(
+        text(
+            """
+            UPDATE posts
+            SET votes_count = counts.n,
+                trending_score =
+                    log(greatest(counts.n, 1)) + extract(epoch from created_at) / 45000
+            FROM (SELECT post_id, count(*) AS n FROM votes GROUP BY post_id) AS counts
+            WHERE posts.id = counts.post_id
+            """
+        )
+    )
+    connection.execute(text("ANALYZE users, posts, votes"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--votes", type=int, default=1_000_000)
+    parser.add_argument("--reset", action="store_true")
+    args = parser.parse_args()
+
+    with create_engine(args.database_url).begin() as connection:
+        seed(connection, args.users, args.posts, args.votes, args.reset)
+
+
+if __name__ == "__main__":
+    main()
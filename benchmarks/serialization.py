@@ -0,0 +1,93 @@
+"""Compare FastAPI's default response path with `app.serializers`.
+
+    python -m benchmarks.serialization --rows 100 --repeat 200
+
+Both paths start from the same ORM rows a `GET /posts/` page returns. The
+default path is FastAPI's own `serialize_response` (validate against
+`List[schemas.PostOut]`, dump, `jsonable_encoder`) followed by
+`JSONResponse`; the fast path builds dicts and renders them with orjson.
+"""
+import argparse
+import asyncio
+import time
+from collections import namedtuple
+from datetime import datetime
+from datetime import timezone
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app import models
+from app import schemas
+from app import serializers
+
+
+Row = namedtuple("Row", ["Post", "votes"])
+
+
+def make_rows(count):
+    now = datetime.now(timezone.utc)
+    owners = [
+        models.User(id=i, email=f"user{i}@gmail.com", created_at=now) for i in range(10)
+    ]
+    return [
+        Row(
+            models.Post(
+                id=i,
+                title=f"title {i}",
+                content="lorem ipsum dolor sit amet " * 20,
+                published=True,
+                created_at=now,
+                owner_id=owners[i % 10].id,
+                owner=owners[i % 10],
+            ),
+            i,
+        )
+        for i in range(count)
+    ]
+
+
+def default_path(loop, field, rows):
+    content = loop.run_until_complete(
+        serialize_response(field=field, response_content=rows)
+    )
+    return JSONResponse(content).body
+
+
+def fast_path(rows):
+    return serializers.response(serializers.posts_out(rows)).body
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    field = create_response_field(name="response", type_=List[schemas.PostOut])
+    loop = asyncio.new_event_loop()
+
+    default = best_of(lambda: default_path(loop, field, rows), args.repeat)
+    fast = best_of(lambda: fast_path(rows), args.repeat)
+    loop.close()
+
+    print(f"rows per page: {args.rows}")
+    print(f"default (pydantic + json): {default * 1000:8.3f} ms")
+    print(f"fast (dicts + orjson):     {fast * 1000:8.3f} ms")
+    print(f"speedup:                   {default / fast:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
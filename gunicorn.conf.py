@@ -0,0 +1,26 @@
+# read by gunicorn from the working directory, see gunicorn.service
+import os
+import shutil
+import tempfile
+
+
+# workers inherit this and write their metrics there, see `app.metrics`. It
+# must be set before prometheus_client is first imported, which picks the
+# in-memory or the file-backed values once; workers fork from this process.
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "prometheus")
+)
+
+
+def on_starting(server):
+    # samples left by a previous run would be added to this one's
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    # drop the live gauges (in-flight requests, pool) of the dead worker
+    multiprocess.mark_process_dead(worker.pid)
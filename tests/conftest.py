@@ -1,14 +1,27 @@
 import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from app import models
+from app.cache import cache
 from app.config import settings
 from app.database import Base
-from app.database import get_db
+from app.database import get_async_session_factory
+from app.database import get_session_factory
+from app.database import instrument_engine
 from app.main import app
 from app.oauth2 import create_access_token
+from app.routers.aio import auth as async_auth
+from app.routers.aio import post as async_post
+from app.routers.aio import user as async_user
+from app.routers.aio import vote as async_vote
+from app.timing import TimingMiddleware
 
 
 SQLALCHEMY_DATABASE_URL = (
@@ -25,11 +38,36 @@ TestingSessionLocal = sessionmaker(
     bind=engine,
 )
 
+# every TestClient request may run on a fresh event loop, so asyncpg
+# connections must not be pooled across requests
+async_engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1),
+    poolclass=NullPool,
+)
+
+instrument_engine(engine)
+instrument_engine(async_engine)
+
+TestingAsyncSessionLocal = async_sessionmaker(
+    autoflush=False,
+    expire_on_commit=False,
+    bind=async_engine,
+)
+
+async_app = FastAPI()
+async_app.add_middleware(TimingMiddleware)
+async_app.include_router(async_post.router)
+async_app.include_router(async_user.router)
+async_app.include_router(async_auth.router)
+async_app.include_router(async_vote.router)
+
 
 @pytest.fixture
 def session():
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    # ids start over with the schema, so cached responses would be stale
+    cache.clear()
     db = TestingSessionLocal()
     try:
         yield db
@@ -38,17 +76,33 @@ def session():
 
 
 @pytest.fixture
-def client(session):
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+def statements():
+    """SQL statements sent to the test database while the fixture is alive."""
+    executed = []
 
-    app.dependency_overrides[get_db] = override_get_db
+    def before_cursor_execute(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def client(session):
+    # every request gets the fixture's session, closed when it is done
+    app.dependency_overrides[get_session_factory] = lambda: lambda: session
     yield TestClient(app)
 
 
+@pytest.fixture
+def async_client(session):
+    async_app.dependency_overrides[
+        get_async_session_factory
+    ] = lambda: TestingAsyncSessionLocal
+    yield TestClient(async_app)
+
+
 @pytest.fixture
 def dummy_user(client):
     user_data = {
@@ -121,4 +175,5 @@ def dummy_posts(dummy_user, dummy_user2, session):
 def dummy_vote(session, dummy_user, dummy_posts):
     new_vote = models.Vote(post_id=dummy_posts[3].id, user_id=dummy_user["id"])
     session.add(new_vote)
+    dummy_posts[3].votes_count += 1
     session.commit()
@@ -0,0 +1,105 @@
+"""Opt-in performance suite: `PERF_TESTS=1 pytest tests/perf`.
+
+The test database is seeded once per run with `benchmarks.seed` (scaled by
+`PERF_SCALE`, 1 = 5000 users, 100k posts, a million votes). The query
+plans are audited for sequential scans with `benchmarks.explain`. Latency
+percentiles are compared against `PERF_BASELINE` (default
+tests/perf/baseline.json). A missing baseline is written from the run, and
+`PERF_UPDATE_BASELINE=1` rewrites it. Baselines depend on the machine, so
+they are not committed.
+"""
+import json
+import os
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app import models
+from app.database import Base
+from app.database import get_session_factory
+from app.main import app
+from app.oauth2 import create_access_token
+from app.utils import encode_cursor
+from benchmarks.seed import seed
+from tests.conftest import engine
+from tests.conftest import TestingSessionLocal
+
+
+if not os.environ.get("PERF_TESTS"):
+    collect_ignore_glob = ["test_*.py"]
+
+SCALE = float(os.environ.get("PERF_SCALE", 1))
+
+BASELINE = Path(
+    os.environ.get("PERF_BASELINE", Path(__file__).parent / "baseline.json")
+)
+
+
+@pytest.fixture(scope="session")
+def seeded():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        seed(
+            connection,
+            users=int(5000 * SCALE),
+            posts=int(100_000 * SCALE),
+            votes=int(1_000_000 * SCALE),
+        )
+
+    with TestingSessionLocal() as db:
+        user = db.scalars(select(models.User).order_by(models.User.id)).first()
+        user_id, email = user.id, user.email
+        own_post_ids = db.scalars(
+            select(models.Post.id).where(models.Post.owner_id == user_id)
+        ).all()
+        voted_post_ids = set(
+            db.scalars(
+                select(models.Vote.post_id).where(models.Vote.user_id == user_id)
+            )
+        )
+        # the key of the page as deep down the listing as GET /posts/?skip
+        deep = db.execute(
+            select(models.Post.created_at, models.Post.id)
+            .order_by(models.Post.created_at.desc(), models.Post.id.desc())
+            .offset(int(50_000 * SCALE))
+            .limit(1)
+        ).one()
+        unvoted_post_ids = db.scalars(
+            select(models.Post.id)
+            .where(models.Post.id.not_in(voted_post_ids))
+            .order_by(models.Post.id)
+            .limit(100)
+        ).all()
+
+    return {
+        "user_id": user_id,
+        "email": email,
+        "own_post_ids": own_post_ids,
+        "unvoted_post_ids": unvoted_post_ids,
+        "cursor": encode_cursor(deep.created_at, deep.id),
+    }
+
+
+@pytest.fixture(scope="session")
+def perf_client(seeded):
+    # a session per request, as in production, instead of the shared test one
+    app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
+    client = TestClient(app)
+    token = create_access_token({"user_id": seeded["user_id"]})
+    client.headers = {**client.headers, "Authorization": f"Bearer {token}"}
+    yield client
+    app.dependency_overrides.pop(get_session_factory)
+
+
+@pytest.fixture(scope="session")
+def baseline():
+    """Percentiles of the baseline run; this run's are collected into it."""
+    previous = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    current = {}
+    yield previous, current
+
+    if current and (not previous or os.environ.get("PERF_UPDATE_BASELINE")):
+        BASELINE.write_text(json.dumps(current, indent=2, sort_keys=True) + "\n")
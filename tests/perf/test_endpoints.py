@@ -0,0 +1,219 @@
+import os
+import statistics
+import time
+from collections import namedtuple
+
+import pytest
+from sqlalchemy import event
+
+from app.cache import cache
+from benchmarks.seed import PASSWORD
+from tests.conftest import engine
+
+
+ITERATIONS = int(os.environ.get("PERF_ITERATIONS", 50))
+# a percentile may grow by this factor over the baseline before the test fails
+TOLERANCE = float(os.environ.get("PERF_TOLERANCE", 1.5))
+
+# `prepare`, if any, runs before each request outside the timing and the
+# statement count; the request gets what it returns in place of `seeded`
+Case = namedtuple(
+    "Case", ["name", "budget", "request", "iterations", "prepare"], defaults=[None]
+)
+
+
+def own_post(seeded, i):
+    posts = seeded["own_post_ids"]
+    return posts[i % len(posts)]
+
+
+def new_post(c, s, i):
+    res = c.post("/posts/", json={"title": "perf", "content": f"{i}"})
+    return {**s, "post_id": res.json()["id"]}
+
+
+def bulk_body(i):
+    return "".join(
+        f'{{"title": "bulk {i}.{n}", "content": "perf"}}\n' for n in range(100)
+    )
+
+
+# `budget` is the most SQL statements one request may send; current user
+# lookups included
+cases = [
+    Case("GET /posts/", 2, lambda c, s, i: c.get("/posts/"), ITERATIONS),
+    Case(
+        "GET /posts/?search",
+        2,
+        lambda c, s, i: c.get("/posts/", params={"search": "postgres indexes"}),
+        ITERATIONS,
+    ),
+    Case(
+        "GET /posts/?skip",
+        2,
+        lambda c, s, i: c.get("/posts/", params={"skip": 50_000}),
+        ITERATIONS,
+    ),
+    Case(
+        "GET /posts/?cursor",
+        2,
+        lambda c, s, i: c.get("/posts/", params={"cursor": s["cursor"]}),
+        ITERATIONS,
+    ),
+    Case(
+        "GET /posts/?view=summary",
+        2,
+        lambda c, s, i: c.get("/posts/", params={"view": "summary"}),
+        ITERATIONS,
+    ),
+    Case("GET /posts/top", 2, lambda c, s, i: c.get("/posts/top"), ITERATIONS),
+    Case(
+        "GET /posts/top?trending",
+        2,
+        lambda c, s, i: c.get("/posts/top", params={"order": "trending"}),
+        ITERATIONS,
+    ),
+    Case(
+        "GET /posts/{id}",
+        2,
+        lambda c, s, i: c.get(f"/posts/{own_post(s, i)}"),
+        ITERATIONS,
+    ),
+    Case(
+        "GET /posts/export",
+        2,
+        lambda c, s, i: c.get("/posts/export"),
+        3,
+    ),
+    Case(
+        # current user, insert, refresh after the commit, owner
+        "POST /posts/",
+        4,
+        lambda c, s, i: c.post("/posts/", json={"title": "perf", "content": f"{i}"}),
+        ITERATIONS,
+    ),
+    Case(
+        # current user, one multi-row insert per 1000 rows
+        "POST /posts/bulk",
+        2,
+        lambda c, s, i: c.post(
+            "/posts/bulk",
+            content=bulk_body(i),
+            headers={"Content-Type": "application/x-ndjson"},
+        ),
+        ITERATIONS,
+    ),
+    Case(
+        "PUT /posts/{id}",
+        2,
+        lambda c, s, i: c.put(
+            f"/posts/{own_post(s, i)}", json={"title": "perf", "content": f"{i}"}
+        ),
+        ITERATIONS,
+    ),
+    Case(
+        "DELETE /posts/{id}",
+        2,
+        lambda c, s, i: c.delete(f"/posts/{s['post_id']}"),
+        ITERATIONS,
+        new_post,
+    ),
+    Case(
+        # add and remove the same vote in turns
+        "POST /vote/",
+        2,
+        lambda c, s, i: c.post(
+            "/vote/",
+            json={"post_id": s["unvoted_post_ids"][0], "dir": 1 - i % 2},
+        ),
+        ITERATIONS,
+    ),
+    Case(
+        "POST /vote/batch",
+        5,
+        lambda c, s, i: c.post(
+            "/vote/batch",
+            json=[
+                {"post_id": post_id, "dir": 1 - i % 2}
+                for post_id in s["unvoted_post_ids"][1:]
+            ],
+        ),
+        ITERATIONS,
+    ),
+    Case(
+        "GET /users/{id}",
+        1,
+        lambda c, s, i: c.get(f"/users/{s['user_id']}"),
+        ITERATIONS,
+    ),
+    Case(
+        # insert, refresh after the commit
+        "POST /users/",
+        2,
+        lambda c, s, i: c.post(
+            "/users/", json={"email": f"perf{i}@example.com", "password": PASSWORD}
+        ),
+        10,
+    ),
+    Case(
+        "POST /login",
+        1,
+        lambda c, s, i: c.post(
+            "/login", data={"username": s["email"], "password": PASSWORD}
+        ),
+        10,
+    ),
+    Case(
+        # current user, bump of the token version
+        "POST /logout",
+        2,
+        lambda c, s, i: c.post("/logout"),
+        ITERATIONS,
+    ),
+]
+
+
+def percentiles(durations):
+    cuts = statistics.quantiles(durations, n=100, method="inclusive")
+    return {
+        "p50": round(cuts[49], 3),
+        "p95": round(cuts[94], 3),
+        "p99": round(cuts[98], 3),
+    }
+
+
+@pytest.mark.parametrize("case", cases, ids=[case.name for case in cases])
+def test_endpoint(case, perf_client, seeded, baseline):
+    previous, current = baseline
+    counts = []
+    durations = []
+
+    def count(*args):
+        counts[-1] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for i in range(case.iterations):
+            counts.append(0)
+            s = case.prepare(perf_client, seeded, i) if case.prepare else seeded
+            counts[-1] = 0
+            # measure the uncached path
+            cache.clear()
+            start = time.perf_counter()
+            res = case.request(perf_client, s, i)
+            durations.append((time.perf_counter() - start) * 1000)
+            assert res.status_code < 400, res.text
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert max(counts) <= case.budget, f"{case.name} sent {max(counts)} statements"
+
+    current[case.name] = {**percentiles(durations), "queries": max(counts)}
+
+    if case.name in previous:
+        for key in ("p50", "p95"):
+            limit = previous[case.name][key] * TOLERANCE
+            assert current[case.name][key] <= limit, (
+                f"{case.name} {key} {current[case.name][key]}ms "
+                f"over {limit:.1f}ms ({TOLERANCE}x the baseline)"
+            )
@@ -0,0 +1,22 @@
+import pytest
+
+from benchmarks.explain import audit
+from tests.conftest import engine
+from tests.perf.conftest import SCALE
+
+
+# below full scale small tables are rightly read whole, and the `skip=50000`
+# listing reaches the end of the posts, so Seq Scans are the cheapest plans
+MIN_SCALE = 1
+
+
+@pytest.mark.skipif(
+    SCALE < MIN_SCALE,
+    reason=f"query plans are only audited at PERF_SCALE >= {MIN_SCALE}",
+)
+def test_no_unexpected_seq_scans(seeded):
+    with engine.connect() as connection:
+        results = audit(connection)
+
+    flagged = {name: sorted(tables) for name, (_, tables) in results.items() if tables}
+    assert not flagged, f"sequential scans in {flagged}"
@@ -0,0 +1,154 @@
+from fastapi import status
+
+from app import oauth2
+from app import schemas
+from app.config import settings
+from tests.test_users import deleted_user_writes
+
+
+def login(async_client, email, password):
+    res = async_client.post("/login", data={"username": email, "password": password})
+    assert res.status_code == status.HTTP_200_OK
+
+    token = schemas.Token(**res.json()).access_token
+    async_client.headers = {
+        **async_client.headers,
+        "Authorization": f"Bearer {token}",
+    }
+
+
+def test_async_user_and_login(async_client):
+    res = async_client.post(
+        "/users/", json={"email": "test@gmail.com", "password": "p@ssword123"}
+    )
+    new_user = schemas.UserOut(**res.json())
+    assert res.status_code == status.HTTP_201_CREATED
+
+    res = async_client.get(f"/users/{new_user.id}")
+    assert res.status_code == status.HTTP_200_OK
+    assert schemas.UserOut(**res.json()) == new_user
+
+    res = async_client.post(
+        "/login", data={"username": "test@gmail.com", "password": "wrongpassword"}
+    )
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_async_posts(async_client, dummy_user, dummy_posts):
+    login(async_client, dummy_user["email"], dummy_user["password"])
+
+    res = async_client.get("/posts/")
+    posts = [schemas.PostOut(**post) for post in res.json()]
+    assert res.status_code == status.HTTP_200_OK
+    assert len(posts) == len(dummy_posts)
+
+    res = async_client.post("/posts/", json={"title": "new", "content": "post"})
+    new_post = schemas.Post(**res.json())
+    assert res.status_code == status.HTTP_201_CREATED
+    assert new_post.owner.email == dummy_user["email"]
+
+    res = async_client.put(
+        f"/posts/{new_post.id}", json={"title": "updated", "content": "post"}
+    )
+    assert res.status_code == status.HTTP_200_OK
+    assert schemas.Post(**res.json()).title == "updated"
+
+    res = async_client.get(f"/posts/{new_post.id}")
+    assert schemas.PostOut(**res.json()).Post.title == "updated"
+
+    res = async_client.get(
+        f"/posts/{new_post.id}", headers={"If-None-Match": res.headers["etag"]}
+    )
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+
+    res = async_client.get("/posts/", params={"fields": "owner"})
+    assert res.status_code == 200
+    assert set(res.json()[0]["Post"]) == {"owner"}
+    res = async_client.get("/posts/", params={"view": "summary", "fields": "owner"})
+    assert res.status_code == 400
+
+    etag = async_client.get("/posts/").headers["etag"]
+    res = async_client.get("/posts/", headers={"If-None-Match": etag})
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+
+    res = async_client.put(
+        f"/posts/{dummy_posts[3].id}", json={"title": "updated", "content": "post"}
+    )
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+    res = async_client.get("/posts/top", params={"order": "trending"})
+    assert len(res.json()) == len(dummy_posts) + 1
+
+    res = async_client.get("/posts/export")
+    assert res.status_code == status.HTTP_200_OK
+    assert len(res.text.splitlines()) == len(dummy_posts) + 1
+
+    res = async_client.delete(f"/posts/{new_post.id}")
+    assert res.status_code == status.HTTP_204_NO_CONTENT
+
+    res = async_client.get(f"/posts/{new_post.id}")
+    assert res.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_async_votes(async_client, dummy_user, dummy_posts):
+    login(async_client, dummy_user["email"], dummy_user["password"])
+    post_id = dummy_posts[3].id
+
+    res = async_client.post("/vote/", json={"post_id": post_id, "dir": 1})
+    assert res.status_code == status.HTTP_201_CREATED
+
+    res = async_client.post("/vote/", json={"post_id": post_id, "dir": 1})
+    assert res.status_code == status.HTTP_409_CONFLICT
+
+    res = async_client.get(f"/posts/{post_id}")
+    assert res.json()["votes"] == 1
+
+    res = async_client.post("/vote/", json={"post_id": post_id, "dir": 0})
+    assert res.status_code == status.HTTP_201_CREATED
+
+    res = async_client.post("/vote/", json={"post_id": post_id, "dir": 0})
+    assert res.status_code == status.HTTP_404_NOT_FOUND
+
+    res = async_client.post("/vote/", json={"post_id": 999, "dir": 1})
+    assert res.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_async_create_posts_bulk(async_client, dummy_user):
+    login(async_client, dummy_user["email"], dummy_user["password"])
+
+    res = async_client.post(
+        "/posts/bulk",
+        json=[{"title": f"bulk {i}", "content": "content"} for i in range(3)],
+    )
+
+    assert res.status_code == status.HTTP_201_CREATED
+    assert len(res.json()["ids"]) == 3
+
+
+def test_async_vote_batch(async_client, dummy_user, dummy_posts):
+    login(async_client, dummy_user["email"], dummy_user["password"])
+    post_id = dummy_posts[3].id
+
+    res = async_client.post(
+        "/vote/batch",
+        json=[{"post_id": post_id, "dir": 1}, {"post_id": post_id, "dir": 1}],
+    )
+
+    assert res.status_code == status.HTTP_200_OK
+    assert [result["status_code"] for result in res.json()] == [
+        status.HTTP_201_CREATED,
+        status.HTTP_409_CONFLICT,
+    ]
+    assert async_client.get(f"/posts/{post_id}").json()["votes"] == 1
+
+
+def test_async_stateless_auth_deleted_user_writes(
+    async_client, dummy_posts, monkeypatch
+):
+    monkeypatch.setattr(settings, "stateless_auth", True)
+    token = oauth2.create_access_token({"user_id": 999, "email": "ghost@gmail.com"})
+    async_client.headers = {**async_client.headers, "Authorization": f"Bearer {token}"}
+
+    for path, json in deleted_user_writes(dummy_posts[0].id):
+        res = async_client.post(path, json=json)
+        assert res.status_code == status.HTTP_401_UNAUTHORIZED, path
@@ -0,0 +1,119 @@
+import pytest
+from fastapi import status
+
+from app import cache as cache_module
+from app.cache import CacheBackend
+from app.cache import MemoryCache
+
+
+@pytest.fixture
+def memory_cache():
+    return MemoryCache(max_entries=2, ttl=60)
+
+
+def test_memory_cache_get_and_set(memory_cache):
+    assert memory_cache.get("post:1") is None
+
+    memory_cache.set("post:1", b"post 1", tags=["post:1"])
+    assert memory_cache.get("post:1") == b"post 1"
+
+    assert memory_cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "entries": 1,
+        "evictions": 0,
+    }
+
+
+def test_memory_cache_evicts_least_recently_used(memory_cache):
+    memory_cache.set("post:1", b"post 1")
+    memory_cache.set("post:2", b"post 2")
+    memory_cache.get("post:1")
+    memory_cache.set("post:3", b"post 3")
+
+    assert memory_cache.get("post:2") is None
+    assert memory_cache.get("post:1") == b"post 1"
+    assert memory_cache.get("post:3") == b"post 3"
+    assert memory_cache.stats()["evictions"] == 1
+
+
+def test_memory_cache_expires_entries(memory_cache, monkeypatch):
+    memory_cache.set("post:1", b"post 1")
+
+    now = cache_module.time.monotonic()
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now + 61)
+
+    assert memory_cache.get("post:1") is None
+    assert memory_cache.stats()["entries"] == 0
+
+
+def test_memory_cache_invalidates_by_tag(memory_cache):
+    memory_cache.set("post:1", b"post 1", tags=["post:1", "user:1"])
+    memory_cache.set("post:2", b"post 2", tags=["post:2", "user:1"])
+
+    memory_cache.invalidate("post:1")
+    assert memory_cache.get("post:1") is None
+    assert memory_cache.get("post:2") == b"post 2"
+
+    memory_cache.invalidate("user:1")
+    assert memory_cache.get("post:2") is None
+
+
+def test_incomplete_backend_cannot_be_created():
+    class NoClear(CacheBackend):
+        def get(self, key):
+            return None
+
+        def set(self, key, value, tags=()):
+            pass
+
+        def invalidate(self, *tags):
+            pass
+
+    with pytest.raises(TypeError):
+        NoClear(max_entries=2, ttl=60)
+
+
+def test_get_post_is_cached(authorized_client, dummy_posts, statements):
+    authorized_client.get(f"/posts/{dummy_posts[0].id}")
+    statements.clear()
+
+    res = authorized_client.get(f"/posts/{dummy_posts[0].id}")
+
+    assert res.status_code == status.HTTP_200_OK
+    assert res.json()["Post"]["id"] == dummy_posts[0].id
+    # only the current user lookup is left
+    assert len(statements) == 1
+
+
+def test_update_post_invalidates_cache(authorized_client, dummy_posts):
+    post_id = dummy_posts[0].id
+    authorized_client.get(f"/posts/{post_id}")
+
+    authorized_client.put(
+        f"/posts/{post_id}", json={"title": "updated title", "content": "content"}
+    )
+    res = authorized_client.get(f"/posts/{post_id}")
+
+    assert res.json()["Post"]["title"] == "updated title"
+
+
+def test_delete_post_invalidates_cache(authorized_client, dummy_posts):
+    post_id = dummy_posts[0].id
+    authorized_client.get(f"/posts/{post_id}")
+
+    authorized_client.delete(f"/posts/{post_id}")
+    res = authorized_client.get(f"/posts/{post_id}")
+
+    assert res.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_get_cache_stats(client, dummy_user):
+    client.get(f"/users/{dummy_user['id']}")
+    client.get(f"/users/{dummy_user['id']}")
+
+    res = client.get("/cache/stats")
+
+    assert res.status_code == status.HTTP_200_OK
+    assert res.json()["hits"] >= 1
+    assert "/cache/stats" not in client.get("/openapi.json").json()["paths"]
@@ -0,0 +1,206 @@
+import pytest
+from fastapi import Request
+from fastapi import status
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import database
+from app.cache import cache
+from app.cache import MemoryCache
+from app.config import settings
+from app.database import get_read_db
+from app.database import get_session_factory
+from app.database import InstrumentedQueuePool
+from app.database import pool_stats
+from app.database import ReplicaSet
+from app.main import app
+from tests.conftest import engine
+from tests.conftest import SQLALCHEMY_DATABASE_URL
+from tests.test_async import login
+
+SQLALCHEMY_ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace(
+    "postgresql://", "postgresql+asyncpg://", 1
+)
+
+
+@pytest.fixture
+def small_engine():
+    small_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    yield small_engine
+    small_engine.dispose()
+
+
+def test_pool_stats(small_engine):
+    with small_engine.connect():
+        stats = pool_stats(small_engine.pool)
+        assert stats["checked_out"] == 1
+        assert stats["checkouts"] == 1
+
+        with pytest.raises(exc.TimeoutError):
+            small_engine.connect()
+
+    stats = pool_stats(small_engine.pool)
+    assert stats["checked_out"] == 0
+    assert stats["checked_in"] == 1
+    assert stats["overflow"] == 0
+    assert stats["timeouts"] == 1
+    assert stats["max_wait_time_seconds"] >= 0.1
+
+
+def test_get_pool_stats(client):
+    res = client.get("/db/pool")
+
+    assert res.status_code == status.HTTP_200_OK
+    assert {"size", "checked_out", "overflow", "timeouts"} <= res.json().keys()
+    # operational, like /metrics: served but not published
+    assert "/db/pool" not in client.get("/openapi.json").json()["paths"]
+
+
+def test_replica_set_round_robin_skips_failed():
+    first, second, third = object(), object(), object()
+    replica_set = ReplicaSet([first, second, third], retry_seconds=60)
+
+    assert replica_set.healthy() == [first, second, third]
+    assert replica_set.healthy() == [second, third, first]
+
+    replica_set.mark_down(third)
+    assert replica_set.healthy() == [first, second]
+    assert replica_set.healthy() == [first, second]
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    # the test database doubles as a healthy replica, behind one that is down
+    down = create_engine("postgresql://nobody@127.0.0.1:1/none")
+    replica = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=InstrumentedQueuePool)
+    replica_set = ReplicaSet([down, replica], retry_seconds=60)
+    monkeypatch.setattr(database, "replicas", replica_set)
+    yield replica
+    replica.dispose()
+
+
+def test_reads_go_to_a_healthy_replica(authorized_client, dummy_posts, replica):
+    res = authorized_client.get("/posts/")
+    assert res.status_code == status.HTTP_200_OK
+    assert len(res.json()) == len(dummy_posts)
+    assert replica.pool.checkouts == 1
+
+    res = authorized_client.get(f"/posts/{dummy_posts[0].id}")
+    assert res.status_code == status.HTTP_200_OK
+    assert replica.pool.checkouts == 2
+
+
+def test_cache_hits_check_out_no_replica(authorized_client, dummy_posts, replica):
+    post_id = dummy_posts[0].id
+
+    authorized_client.get(f"/posts/{post_id}")
+    res = authorized_client.get(f"/posts/{post_id}")
+
+    assert res.status_code == status.HTTP_200_OK
+    assert replica.pool.checkouts == 1
+
+
+def test_reads_fall_back_to_the_primary(authorized_client, dummy_posts, monkeypatch):
+    down = create_engine("postgresql://nobody@127.0.0.1:1/none")
+    replica_set = ReplicaSet([down], retry_seconds=60)
+    monkeypatch.setattr(database, "replicas", replica_set)
+    monkeypatch.setattr(database, "engine", engine)
+
+    res = authorized_client.get("/posts/")
+
+    assert res.status_code == status.HTTP_200_OK
+    assert len(res.json()) == len(dummy_posts)
+    assert replica_set.healthy() == []
+
+
+def test_async_reads_go_to_a_healthy_replica(
+    async_client, dummy_user, dummy_posts, monkeypatch
+):
+    down = create_async_engine("postgresql+asyncpg://nobody@127.0.0.1:1/none")
+    replica = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=NullPool)
+    connects = []
+    event.listen(replica.sync_engine, "connect", lambda *args: connects.append(True))
+    monkeypatch.setattr(
+        database, "async_replicas", ReplicaSet([down, replica], retry_seconds=60)
+    )
+    login(async_client, dummy_user["email"], dummy_user["password"])
+
+    res = async_client.get("/posts/")
+
+    assert res.status_code == status.HTTP_200_OK
+    assert len(res.json()) == len(dummy_posts)
+    assert len(connects) == 1
+
+
+def test_writes_stay_on_the_primary(authorized_client, replica):
+    res = authorized_client.post("/posts/", json={"title": "t", "content": "c"})
+
+    assert res.status_code == status.HTTP_201_CREATED
+    assert replica.pool.checkouts == 0
+
+
+@pytest.fixture
+def read_your_writes(monkeypatch):
+    monkeypatch.setattr(settings, "read_your_writes_seconds", 30)
+    monkeypatch.setattr(database, "write_markers", MemoryCache(100, ttl=30))
+
+
+def test_read_your_writes(authorized_client, dummy_posts, replica, read_your_writes):
+
+    authorized_client.get("/posts/")
+    assert replica.pool.checkouts == 1
+
+    authorized_client.post("/posts/", json={"title": "t", "content": "c"})
+    res = authorized_client.get("/posts/")
+
+    assert len(res.json()) == len(dummy_posts) + 1
+    assert replica.pool.checkouts == 1
+
+
+def test_write_markers_stay_out_of_the_cache_stats(
+    authorized_client, dummy_posts, replica, read_your_writes
+):
+    before = cache.stats()
+    authorized_client.get("/posts/")
+    authorized_client.post("/posts/", json={"title": "t", "content": "c"})
+    authorized_client.get("/posts/")
+
+    assert cache.stats() == before
+
+
+def test_replica_read_opens_no_primary_session(replica):
+    opened = []
+
+    def session_factory():
+        opened.append(True)
+
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+    reads = get_read_db(request, session_factory)
+    db = next(reads)
+
+    assert db.get_bind() is replica
+    assert opened == []
+    reads.close()
+
+
+def test_primary_read_shares_the_auth_session(authorized_client, session, dummy_posts):
+    opened = []
+
+    def session_factory():
+        opened.append(True)
+        return session
+
+    app.dependency_overrides[get_session_factory] = lambda: session_factory
+    res = authorized_client.get("/posts/")
+
+    assert res.status_code == status.HTTP_200_OK
+    assert len(opened) == 1
@@ -0,0 +1,104 @@
+import os
+import subprocess  # noqa: S404
+import sys
+
+from fastapi import status
+from prometheus_client.parser import text_string_to_metric_families
+from sqlalchemy import create_engine
+
+from app.database import instrument_pool
+from tests.conftest import SQLALCHEMY_DATABASE_URL
+
+
+def sample(client, name, **labels):
+    res = client.get("/metrics")
+    assert res.status_code == status.HTTP_200_OK
+
+    for family in text_string_to_metric_families(res.text):
+        for metric in family.samples:
+            if metric.name == name and metric.labels == labels:
+                return metric.value
+    return 0
+
+
+def test_request_duration_by_route(authorized_client, dummy_posts):
+    labels = {"method": "GET", "route": "/posts/{id}", "status": "200"}
+    before = sample(authorized_client, "http_request_duration_seconds_count", **labels)
+
+    authorized_client.get(f"/posts/{dummy_posts[0].id}")
+    authorized_client.get(f"/posts/{dummy_posts[1].id}")
+
+    after = sample(authorized_client, "http_request_duration_seconds_count", **labels)
+    assert after == before + 2
+
+
+def test_unmatched_routes_share_a_label(client):
+    client.get("/no/such/path")
+
+    labels = {"method": "GET", "route": "<unmatched>", "status": "404"}
+    assert sample(client, "http_request_duration_seconds_count", **labels) >= 1
+
+
+def test_password_hash_duration(client):
+    labels = {"operation": "hash_password"}
+    before = sample(client, "password_hash_duration_seconds_count", **labels)
+
+    client.post("/users/", json={"email": "metrics@gmail.com", "password": "pw"})
+
+    after = sample(client, "password_hash_duration_seconds_count", **labels)
+    assert after == before + 1
+
+
+def test_in_progress_and_pool_gauges(client):
+    # the scrape itself is in flight while the gauge is read
+    assert sample(client, "http_requests_in_progress", method="GET") == 1
+    assert "db_pool_checked_out_connections" in client.get("/metrics").text
+
+
+def test_pool_gauges_are_labelled_by_pool(client):
+    first = create_engine(SQLALCHEMY_DATABASE_URL)
+    second = create_engine(SQLALCHEMY_DATABASE_URL)
+    instrument_pool(first, "first")
+    instrument_pool(second, "second")
+
+    with first.connect(), first.connect(), second.connect():
+        name = "db_pool_checked_out_connections"
+        assert sample(client, name, pool="first") == 2
+        assert sample(client, name, pool="second") == 1
+
+    first.dispose()
+    second.dispose()
+
+
+# prometheus_client is imported by the tests already, so gunicorn's order of
+# loading the config first and the app second is replayed in a fresh process
+GUNICORN_WORKER = """
+import runpy
+import sys
+
+config = runpy.run_path("gunicorn.conf.py")
+config["on_starting"](None)
+
+from fastapi.testclient import TestClient
+from app.main import app
+from app.metrics import metrics_response
+
+TestClient(app).get("/")
+sys.stdout.write(metrics_response().body.decode())
+"""
+
+
+def test_gunicorn_config_collects_app_metrics(tmp_path):
+    env = {**os.environ, "TMPDIR": str(tmp_path)}
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+    scrape = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", GUNICORN_WORKER],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    assert "http_request_duration_seconds" in scrape
+    assert (tmp_path / "prometheus").is_dir()
@@ -1,7 +1,17 @@
+import csv
+import io
+import json
+
 import pytest
 from fastapi import status
 
+from app import export
+from app import models
 from app import schemas
+from app.cache import cache
+from app.config import settings
+from app.oauth2 import create_access_token
+from tests.conftest import TestingSessionLocal
 
 
 def test_get_all_posts(authorized_client, dummy_posts):
@@ -12,11 +22,364 @@ def test_get_all_posts(authorized_client, dummy_posts):
     assert len(res.json()) == len(posts_list)
 
 
+def test_get_posts_cursor_pagination(authorized_client, dummy_posts):
+    seen = []
+    res = authorized_client.get("/posts/", params={"limit": 3})
+    while True:
+        assert res.status_code == status.HTTP_200_OK
+        seen.extend(post["Post"]["id"] for post in res.json())
+
+        next_cursor = res.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            break
+        res = authorized_client.get(
+            "/posts/", params={"limit": 3, "cursor": next_cursor}
+        )
+
+    assert seen == sorted((post.id for post in dummy_posts), reverse=True)
+
+
+def test_get_posts_cursor_matches_offset(authorized_client, dummy_posts):
+    first = authorized_client.get("/posts/", params={"limit": 2})
+    by_cursor = authorized_client.get(
+        "/posts/", params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]}
+    )
+    by_offset = authorized_client.get("/posts/", params={"limit": 2, "skip": 2})
+
+    assert by_cursor.json() == by_offset.json()
+
+
+def test_get_posts_invalid_cursor(authorized_client, dummy_posts):
+    res = authorized_client.get("/posts/", params={"cursor": "not-a-cursor"})
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize(
+    "params, expected",
+    [
+        ({"search": "post 3"}, {"Test Post 3"}),
+        ({"search": "posts"}, {"Test Post 1", "Test Post 2", "Test Post 3"}),
+        ({"search": "content 1"}, set()),
+        ({"search": "content 1", "search_content": True}, {"Test Post 1"}),
+        ({"search": ""}, {"Test Post 1", "Test Post 2", "Test Post 3"}),
+    ],
+)
+def test_get_posts_search(authorized_client, dummy_posts, params, expected):
+    res = authorized_client.get("/posts/", params=params)
+
+    assert res.status_code == status.HTTP_200_OK
+    assert {post["Post"]["title"] for post in res.json()} == expected
+
+
+def test_get_posts_search_by_relevance(authorized_client, session, dummy_user):
+    session.add_all(
+        [
+            models.Post(
+                title="fastapi", content="unrelated", owner_id=dummy_user["id"]
+            ),
+            models.Post(
+                title="fastapi fastapi", content="fastapi", owner_id=dummy_user["id"]
+            ),
+        ]
+    )
+    session.commit()
+
+    res = authorized_client.get(
+        "/posts/",
+        params={"search": "fastapi", "sort": "relevance", "search_content": True},
+    )
+
+    assert res.status_code == status.HTTP_200_OK
+    assert [post["Post"]["title"] for post in res.json()] == [
+        "fastapi fastapi",
+        "fastapi",
+    ]
+
+
+@pytest.fixture
+def posts_by_many_owners(session, dummy_user):
+    owners = [
+        models.User(email=f"owner{i}@gmail.com", password="not-a-hash")  # noqa: S106
+        for i in range(12)
+    ]
+    session.add_all(owners)
+    session.flush()
+    session.add_all(
+        [
+            models.Post(title=f"post {i}", content="content", owner_id=owner.id)
+            for i, owner in enumerate(owners)
+        ]
+    )
+    session.commit()
+
+
+def test_get_posts_query_count_is_constant(
+    authorized_client, posts_by_many_owners, statements
+):
+    query_counts = []
+    for limit in (1, 5, 12):
+        statements.clear()
+        res = authorized_client.get("/posts/", params={"limit": limit})
+
+        assert res.status_code == status.HTTP_200_OK
+        assert len(res.json()) == limit
+        query_counts.append(len(statements))
+
+    assert len(set(query_counts)) == 1
+
+
+def test_get_posts_fields(authorized_client, dummy_posts, statements):
+    statements.clear()
+    res = authorized_client.get("/posts/", params={"fields": "title, id,title"})
+
+    assert res.status_code == status.HTTP_200_OK
+    post = res.json()[0]
+    assert post == {
+        "Post": {"id": post["Post"]["id"], "title": post["Post"]["title"]},
+        "votes": 0,
+    }
+    assert "content" not in statements[-1]
+    assert "JOIN" not in statements[-1]
+
+    full = authorized_client.get("/posts/").json()
+    res = authorized_client.get("/posts/", params={"fields": "owner"})
+    assert res.json() == [
+        {"Post": {"owner": post["Post"]["owner"]}, "votes": post["votes"]}
+        for post in full
+    ]
+
+
+def test_get_posts_summary(authorized_client, dummy_posts, monkeypatch):
+    monkeypatch.setattr(settings, "post_preview_length", 5)
+    full = authorized_client.get("/posts/").json()
+    res = authorized_client.get("/posts/", params={"view": "summary"})
+
+    assert res.status_code == status.HTTP_200_OK
+    for summary, post in zip(res.json(), full):
+        assert set(summary["Post"]) == {
+            "id",
+            "title",
+            "content_preview",
+            "published",
+            "created_at",
+            "owner_id",
+        }
+        assert summary["Post"]["content_preview"] == post["Post"]["content"][:5]
+        assert summary["votes"] == post["votes"]
+
+
+def test_get_posts_summary_cursor_and_etag(authorized_client, dummy_posts):
+    params = {"view": "summary", "limit": 2}
+    first = authorized_client.get("/posts/", params=params)
+    by_cursor = authorized_client.get(
+        "/posts/", params={**params, "cursor": first.headers["X-Next-Cursor"]}
+    )
+    by_offset = authorized_client.get("/posts/", params={**params, "skip": 2})
+    assert by_cursor.json() == by_offset.json()
+
+    # the same page in another shape is another representation
+    full_etag = authorized_client.get("/posts/", params={"limit": 2}).headers["etag"]
+    assert first.headers["etag"] != full_etag
+    res = authorized_client.get(
+        "/posts/", params=params, headers={"If-None-Match": first.headers["etag"]}
+    )
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_get_posts_unknown_fields(authorized_client, dummy_posts):
+    res = authorized_client.get("/posts/", params={"fields": "title,password"})
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+    assert res.json()["detail"] == "unknown fields: password"
+
+
+@pytest.mark.parametrize(
+    "params",
+    [{"fields": ""}, {"fields": " , "}, {"fields": "title", "view": "summary"}],
+)
+def test_get_posts_invalid_field_selection(authorized_client, dummy_posts, params):
+    res = authorized_client.get("/posts/", params=params)
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_get_posts_summary_etag_follows_preview_length(
+    authorized_client, dummy_posts, monkeypatch
+):
+    params = {"view": "summary"}
+    etag = authorized_client.get("/posts/", params=params).headers["etag"]
+
+    monkeypatch.setattr(settings, "post_preview_length", 3)
+    res = authorized_client.get(
+        "/posts/", params=params, headers={"If-None-Match": etag}
+    )
+    assert res.status_code == status.HTTP_200_OK
+    assert res.headers["etag"] != etag
+
+
 def test_get_all_posts_unauthorized_user(client, dummy_posts):
     res = client.get("/posts/")
     assert res.status_code == status.HTTP_401_UNAUTHORIZED
 
 
+def test_export_posts_ndjson(authorized_client, dummy_posts, dummy_vote, monkeypatch):
+    # several round trips through the server-side cursor
+    monkeypatch.setattr(settings, "export_chunk_size", 2)
+    ids = sorted(post.id for post in dummy_posts)
+    res = authorized_client.get("/posts/export")
+
+    assert res.status_code == status.HTTP_200_OK
+    assert res.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in res.text.splitlines()]
+    assert [row["id"] for row in rows] == ids
+    assert [row["votes"] for row in rows] == [0, 0, 0, 1]
+
+
+def test_export_posts_csv(authorized_client, dummy_posts):
+    title = dummy_posts[0].title
+    res = authorized_client.get("/posts/export", params={"format": "csv"})
+
+    assert res.status_code == status.HTTP_200_OK
+    rows = list(csv.DictReader(io.StringIO(res.text)))
+    assert len(rows) == len(dummy_posts)
+    assert rows[0]["title"] == title
+
+
+def test_export_posts_cli(session, dummy_posts, tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "SessionLocal", TestingSessionLocal)
+    output = tmp_path / "posts.ndjson"
+
+    export.main(["--output", str(output)])
+
+    assert len(output.read_text().splitlines()) == len(dummy_posts)
+
+
+def test_export_posts_unauthorized_user(client, dummy_posts):
+    res = client.get("/posts/export")
+    assert res.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_top_posts_by_votes(authorized_client, dummy_posts, dummy_vote):
+    ids = [post.id for post in dummy_posts]
+    res = authorized_client.get("/posts/top")
+
+    assert res.status_code == status.HTTP_200_OK
+    # most votes first, then the newest
+    assert [post["Post"]["id"] for post in res.json()] == [
+        ids[3],
+        ids[2],
+        ids[1],
+        ids[0],
+    ]
+
+
+def test_top_posts_trending(authorized_client, session, dummy_user2, dummy_posts):
+    oldest_id = dummy_posts[0].id
+    token2 = create_access_token({"user_id": dummy_user2["id"]})
+
+    authorized_client.post("/vote/", json={"post_id": oldest_id, "dir": 1})
+    authorized_client.post(
+        "/vote/",
+        json={"post_id": oldest_id, "dir": 1},
+        headers={"Authorization": f"Bearer {token2}"},
+    )
+    res = authorized_client.get("/posts/top", params={"order": "trending", "limit": 1})
+
+    # two votes outweigh the few milliseconds the other posts are newer by
+    assert [post["Post"]["id"] for post in res.json()] == [oldest_id]
+
+    authorized_client.post("/vote/", json={"post_id": oldest_id, "dir": 0})
+    post = session.get(models.Post, oldest_id, populate_existing=True)
+    assert post.trending_score == pytest.approx(
+        post.created_at.timestamp() / models.TRENDING_DECAY_SECONDS
+    )
+
+
+def test_get_post_not_modified(authorized_client, dummy_posts, statements):
+    post_id = dummy_posts[0].id
+    res = authorized_client.get(f"/posts/{post_id}")
+    etag = res.headers["etag"]
+
+    res = authorized_client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+    assert res.headers["etag"] == etag
+    assert res.content == b""
+
+    # without a cached copy the version alone decides
+    cache.clear()
+    statements.clear()
+    res = authorized_client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+    assert len(statements) == 2
+    assert "JOIN" not in statements[1]
+
+
+def test_get_post_etag_changes_with_writes(authorized_client, dummy_posts):
+    post_id = dummy_posts[0].id
+    etag = authorized_client.get(f"/posts/{post_id}").headers["etag"]
+
+    authorized_client.post("/vote/", json={"post_id": post_id, "dir": 1})
+    res = authorized_client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert res.status_code == status.HTTP_200_OK
+    assert res.json()["votes"] == 1
+    voted_etag = res.headers["etag"]
+    assert voted_etag != etag
+
+    authorized_client.put(f"/posts/{post_id}", json={"title": "new", "content": "c"})
+    res = authorized_client.get(
+        f"/posts/{post_id}", headers={"If-None-Match": voted_etag}
+    )
+    assert res.status_code == status.HTTP_200_OK
+    assert res.json()["Post"]["title"] == "new"
+
+
+def test_get_posts_not_modified(authorized_client, dummy_posts, statements):
+    etag = authorized_client.get("/posts/").headers["etag"]
+
+    statements.clear()
+    res = authorized_client.get("/posts/", headers={"If-None-Match": etag})
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+    # the current user, then the (id, version) probe
+    assert len(statements) == 2
+    assert "JOIN" not in statements[1]
+
+    authorized_client.post("/posts/", json={"title": "t", "content": "c"})
+    res = authorized_client.get("/posts/", headers={"If-None-Match": etag})
+    assert res.status_code == status.HTTP_200_OK
+    assert res.headers["etag"] != etag
+
+
+def test_get_posts_not_modified_keeps_cursor(authorized_client, dummy_posts):
+    first = authorized_client.get("/posts/", params={"limit": 2})
+
+    res = authorized_client.get(
+        "/posts/", params={"limit": 2}, headers={"If-None-Match": first.headers["etag"]}
+    )
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+    assert res.headers["x-next-cursor"] == first.headers["x-next-cursor"]
+
+
+def test_get_posts_offset_not_modified_is_one_query(
+    authorized_client, dummy_posts, statements
+):
+    params = {"limit": 2, "skip": 1}
+    first = authorized_client.get("/posts/", params=params)
+
+    statements.clear()
+    res = authorized_client.get(
+        "/posts/", params=params, headers={"If-None-Match": first.headers["etag"]}
+    )
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+    assert res.headers["x-next-cursor"] == first.headers["x-next-cursor"]
+    # the current user, then the page itself; no separate probe
+    assert len(statements) == 2
+
+    statements.clear()
+    res = authorized_client.get(
+        "/posts/", params=params, headers={"If-None-Match": '"stale"'}
+    )
+    assert res.status_code == status.HTTP_200_OK
+    assert len(statements) == 2
+
+
 def test_get_one_post_not_exist(authorized_client, dummy_posts):
     res = authorized_client.get("/posts/999")
     assert res.status_code == status.HTTP_404_NOT_FOUND
@@ -60,6 +423,72 @@ def test_create_post(authorized_client, dummy_user, title, content, published):
     assert created_post.owner_id == dummy_user["id"]
 
 
+def test_create_posts_bulk(authorized_client, dummy_user, monkeypatch, statements):
+    monkeypatch.setattr(settings, "bulk_chunk_size", 2)
+    posts = [{"title": f"bulk {i}", "content": "content"} for i in range(5)]
+
+    res = authorized_client.post("/posts/bulk", json=posts)
+    ids = res.json()["ids"]
+    assert res.status_code == status.HTTP_201_CREATED
+    assert len(ids) == 5
+
+    inserts = [sql for sql in statements if sql.startswith("INSERT INTO posts")]
+    assert len(inserts) == 3
+
+    for id, post in zip(ids, posts):
+        created_post = schemas.PostOut(**authorized_client.get(f"/posts/{id}").json())
+        assert created_post.Post.title == post["title"]
+        assert created_post.Post.owner_id == dummy_user["id"]
+
+
+def test_create_posts_bulk_ndjson(authorized_client, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_chunk_size", 2)
+    body = "\n".join(
+        json.dumps({"title": f"bulk {i}", "content": "content"}) for i in range(3)
+    )
+
+    res = authorized_client.post(
+        "/posts/bulk",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    assert res.status_code == status.HTTP_201_CREATED
+    assert len(res.json()["ids"]) == 3
+
+
+def test_create_posts_bulk_invalid(authorized_client, session):
+    res = authorized_client.post(
+        "/posts/bulk", json=[{"title": "bulk", "content": "content"}, {"title": 1}]
+    )
+
+    assert res.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert res.json()["detail"][0]["loc"][:2] == ["body", 1]
+    assert session.query(models.Post).count() == 0
+
+
+def test_create_posts_bulk_ndjson_partially_invalid(authorized_client, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_chunk_size", 2)
+    lines = [{"title": f"bulk {i}", "content": "content"} for i in range(3)]
+    lines.append({"title": "missing content"})
+
+    res = authorized_client.post(
+        "/posts/bulk",
+        content="\n".join(json.dumps(line) for line in lines),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    # the first chunk was committed before line 4 was read
+    assert res.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert len(res.json()["ids"]) == 2
+    assert res.json()["detail"][0]["loc"][:2] == ["body", 4]
+
+
+def test_create_posts_bulk_unauthorized_user(client):
+    res = client.post("/posts/bulk", json=[{"title": "bulk", "content": "content"}])
+    assert res.status_code == status.HTTP_401_UNAUTHORIZED
+
+
 def test_create_post_default_published(authorized_client, dummy_user):
     res = authorized_client.post(
         "/posts/",
@@ -94,6 +523,18 @@ def test_delete_post(authorized_client, dummy_posts):
     assert res.status_code == status.HTTP_204_NO_CONTENT
 
 
+def test_delete_post_is_one_statement(authorized_client, dummy_posts, statements):
+    post_id = dummy_posts[0].id
+    statements.clear()
+
+    res = authorized_client.delete(f"/posts/{post_id}")
+
+    assert res.status_code == status.HTTP_204_NO_CONTENT
+    # the current user, then the delete
+    assert len(statements) == 2
+    assert statements[1].startswith("DELETE")
+
+
 def test_delete_post_forbidden(authorized_client, dummy_posts):
     res = authorized_client.delete(f"/posts/{dummy_posts[3].id}")
     assert res.status_code == status.HTTP_403_FORBIDDEN
@@ -124,6 +565,24 @@ def test_update_post(authorized_client, dummy_user, dummy_posts):
     assert updated_post.owner_id == dummy_user["id"]
 
 
+def test_update_post_is_one_statement(
+    authorized_client, dummy_user, dummy_posts, statements
+):
+    post_id = dummy_posts[0].id
+    statements.clear()
+
+    res = authorized_client.put(
+        f"/posts/{post_id}",
+        json={"title": "updated title", "content": "updated content"},
+    )
+
+    assert res.status_code == status.HTTP_200_OK
+    assert res.json()["owner"]["email"] == dummy_user["email"]
+    # the current user, then the update returning the post and its owner
+    assert len(statements) == 2
+    assert "UPDATE posts" in statements[1]
+
+
 def test_update_post_forbidden(authorized_client, dummy_user2, dummy_posts):
     data = {
         "title": "updated title",
@@ -0,0 +1,22 @@
+import orjson
+from sqlalchemy.orm import joinedload
+
+from app import models
+from app import schemas
+from app import serializers
+
+
+def test_serializers_match_schemas(session, dummy_posts):
+    rows = (
+        session.query(models.Post, models.Post.votes_count.label("votes"))
+        .options(joinedload(models.Post.owner))
+        .all()
+    )
+
+    body = serializers.response(serializers.posts_out(rows)).body
+
+    for row, data in zip(rows, orjson.loads(body)):
+        assert schemas.PostOut(**data) == schemas.PostOut.model_validate(row)
+        assert data.keys() == schemas.PostOut.model_fields.keys()
+        assert data["Post"].keys() == schemas.Post.model_fields.keys()
+        assert data["Post"]["owner"].keys() == schemas.UserOut.model_fields.keys()
@@ -0,0 +1,72 @@
+import logging
+
+import pytest
+from fastapi import status
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.timing import RequestTimings
+from tests.conftest import engine
+from tests.test_async import login
+
+
+def parse_server_timing(header):
+    metrics = {}
+    for metric in header.split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+def test_server_timing_header(authorized_client, dummy_posts):
+    res = authorized_client.get("/posts/")
+
+    assert res.status_code == status.HTTP_200_OK
+    metrics = parse_server_timing(res.headers["server-timing"])
+    assert {"app", "auth", "handler", "db", "serialize"} <= metrics.keys()
+    # the current user, then the page of posts
+    assert metrics["db"]["desc"] == '"2 queries"'
+    assert float(metrics["db"]["dur"]) <= float(metrics["app"]["dur"])
+    assert float(metrics["handler"]["dur"]) <= float(metrics["app"]["dur"])
+
+
+def test_failed_statement_leaves_nothing_on_the_connection(session):
+    with engine.connect() as connection:
+        with pytest.raises(DBAPIError):
+            connection.execute(text("SELECT 1 / 0"))
+        connection.rollback()
+        connection.execute(text("SELECT 1"))
+
+        assert connection.info == {}
+
+
+def test_request_log_fields(authorized_client, dummy_posts, caplog):
+    with caplog.at_level(logging.INFO, logger="app.timing"):
+        authorized_client.get(f"/posts/{dummy_posts[0].id}")
+
+    (record,) = caplog.records
+    assert record.method == "GET"
+    assert record.path == f"/posts/{dummy_posts[0].id}"
+    assert record.status_code == status.HTTP_200_OK
+    assert record.db_queries == 2
+    assert record.duration_ms >= record.app_ms
+
+
+def test_server_timing_header_async(async_client, dummy_user, dummy_posts):
+    login(async_client, dummy_user["email"], dummy_user["password"])
+
+    res = async_client.get("/posts/")
+
+    metrics = parse_server_timing(res.headers["server-timing"])
+    assert metrics["db"]["desc"] == '"2 queries"'
+    assert "handler" in metrics
+
+
+def test_server_timing_format():
+    timings = RequestTimings()
+    timings.record("db", 0.002)
+    timings.record("db", 0.001)
+    timings.record("serialize", 0.0005)
+
+    assert timings.server_timing() == 'db;dur=3.0;desc="2 queries", serialize;dur=0.5'
+    assert timings.log_fields() == {"db_ms": 3.0, "serialize_ms": 0.5, "db_queries": 2}
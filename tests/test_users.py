@@ -1,8 +1,14 @@
+import threading
+
 import pytest
 from fastapi import status
 from jose import jwt
+from passlib.context import CryptContext
 
+from app import models
+from app import oauth2
 from app import schemas
+from app import utils
 from app.config import settings
 
 
@@ -24,6 +30,7 @@ def test_login(client, dummy_user):
 
     assert res.status_code == status.HTTP_200_OK
     assert id == dummy_user["id"]
+    assert payload.get("email") == dummy_user["email"]
     assert login_res.token_type == "bearer"  # noqa: S105
 
 
@@ -55,3 +62,99 @@ def test_create_user(client):
     new_user = schemas.UserOut(**res.json())
     assert res.status_code == status.HTTP_201_CREATED
     assert new_user.email == "test@gmail.com"
+
+
+def test_get_user_not_modified(client, dummy_user):
+    res = client.get(f"/users/{dummy_user['id']}")
+    assert res.status_code == status.HTTP_200_OK
+    etag = res.headers["etag"]
+
+    res = client.get(f"/users/{dummy_user['id']}", headers={"If-None-Match": etag})
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+
+    res = client.get(f"/users/{dummy_user['id']}", headers={"If-None-Match": "*"})
+    assert res.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_login_rehashes_outdated_cost(client, session, dummy_user):
+    user = session.get(models.User, dummy_user["id"])
+    user.password = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(
+        dummy_user["password"]
+    )
+    session.commit()
+
+    res = client.post(
+        "/login",
+        data={"username": dummy_user["email"], "password": dummy_user["password"]},
+    )
+    assert res.status_code == status.HTTP_200_OK
+
+    user = session.get(models.User, dummy_user["id"])
+    assert user.password.startswith(f"$2b${settings.bcrypt_rounds:02d}$")
+    assert utils.verify(dummy_user["password"], user.password)
+
+
+def test_create_user_hashing_overloaded(client, monkeypatch):
+    monkeypatch.setattr(utils, "hash_slots", threading.BoundedSemaphore(1))
+    utils.hash_slots.acquire()
+
+    res = client.post(
+        "/users/", json={"email": "test@gmail.com", "password": "p@ssword123"}
+    )
+
+    assert res.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert res.headers["Retry-After"] == "1"
+
+
+def test_stateless_auth_skips_user_lookup(client, monkeypatch):
+    # the user behind this token does not exist, only its claims do
+    token = oauth2.create_access_token({"user_id": 999, "email": "ghost@gmail.com"})
+    client.headers = {**client.headers, "Authorization": f"Bearer {token}"}
+
+    res = client.get("/posts/")
+    assert res.status_code == status.HTTP_401_UNAUTHORIZED
+
+    monkeypatch.setattr(settings, "stateless_auth", True)
+    res = client.get("/posts/")
+    assert res.status_code == status.HTTP_200_OK
+
+
+def deleted_user_writes(post_id):
+    post = {"title": "title", "content": "content"}
+    vote = {"post_id": post_id, "dir": 1}
+    return [
+        ("/posts/", post),
+        ("/posts/bulk", [post]),
+        ("/vote/", vote),
+        ("/vote/batch", [vote]),
+    ]
+
+
+def test_stateless_auth_deleted_user_writes(client, dummy_posts, monkeypatch):
+    monkeypatch.setattr(settings, "stateless_auth", True)
+    token = oauth2.create_access_token({"user_id": 999, "email": "ghost@gmail.com"})
+    client.headers = {**client.headers, "Authorization": f"Bearer {token}"}
+
+    for path, json in deleted_user_writes(dummy_posts[0].id):
+        res = client.post(path, json=json)
+        assert res.status_code == status.HTTP_401_UNAUTHORIZED, path
+
+
+@pytest.mark.parametrize("stateless_auth", [False, True])
+def test_logout_revokes_tokens(client, dummy_user, monkeypatch, stateless_auth):
+    monkeypatch.setattr(settings, "stateless_auth", stateless_auth)
+    monkeypatch.setattr(settings, "token_version_check", True)
+
+    res = client.post(
+        "/login",
+        data={"username": dummy_user["email"], "password": dummy_user["password"]},
+    )
+    token = schemas.Token(**res.json()).access_token
+    client.headers = {**client.headers, "Authorization": f"Bearer {token}"}
+
+    assert client.get("/posts/").status_code == status.HTTP_200_OK
+
+    res = client.post("/logout")
+    assert res.status_code == status.HTTP_204_NO_CONTENT
+
+    assert client.get("/posts/").status_code == status.HTTP_401_UNAUTHORIZED
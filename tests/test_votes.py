@@ -1,4 +1,12 @@
+import pytest
 from fastapi import status
+from sqlalchemy.exc import OperationalError
+
+from app import models
+from app.config import settings
+from app.routers import vote as vote_router
+from app.vote_buffer import VoteBuffer
+from tests.conftest import TestingSessionLocal
 
 
 def test_vote_on_post(authorized_client, dummy_posts):
@@ -12,6 +20,18 @@ def test_vote_on_post(authorized_client, dummy_posts):
     assert res.status_code == status.HTTP_201_CREATED
 
 
+def test_vote_updates_votes_count(authorized_client, dummy_posts):
+    post_id = dummy_posts[3].id
+
+    authorized_client.post("/vote/", json={"post_id": post_id, "dir": 1})
+    res = authorized_client.get(f"/posts/{post_id}")
+    assert res.json()["votes"] == 1
+
+    authorized_client.post("/vote/", json={"post_id": post_id, "dir": 0})
+    res = authorized_client.get(f"/posts/{post_id}")
+    assert res.json()["votes"] == 0
+
+
 def test_vote_twice_on_post(authorized_client, dummy_posts, dummy_vote):
     res = authorized_client.post(
         "/vote/",
@@ -65,3 +85,216 @@ def test_vote_on_post_unauthorized_user(client, dummy_posts):
         },
     )
     assert res.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_vote_batch(authorized_client, dummy_posts, dummy_vote, statements):
+    post_ids = [post.id for post in dummy_posts]
+    votes = [
+        {"post_id": post_ids[0], "dir": 1},
+        {"post_id": post_ids[0], "dir": 1},
+        {"post_id": post_ids[1], "dir": 1},
+        {"post_id": post_ids[1], "dir": 0},
+        {"post_id": post_ids[2], "dir": 0},
+        {"post_id": post_ids[3], "dir": 0},
+        {"post_id": 999, "dir": 1},
+    ]
+    statements.clear()
+
+    res = authorized_client.post("/vote/batch", json=votes)
+
+    assert res.status_code == status.HTTP_200_OK
+    assert [result["status_code"] for result in res.json()] == [
+        status.HTTP_201_CREATED,
+        status.HTTP_409_CONFLICT,
+        status.HTTP_201_CREATED,
+        status.HTTP_201_CREATED,
+        status.HTTP_404_NOT_FOUND,
+        status.HTTP_201_CREATED,
+        status.HTTP_404_NOT_FOUND,
+    ]
+    assert res.json()[4]["detail"] == "Vote does not exist"
+    assert res.json()[6]["detail"] == "Post with 999 does not exist"
+
+    # the current user, two lookups, then one insert and one delete statement
+    # that update the counters as well
+    assert len(statements) == 5
+
+    votes_by_post = {
+        post["Post"]["id"]: post["votes"]
+        for post in authorized_client.get("/posts/").json()
+    }
+    assert votes_by_post == dict(zip(post_ids, [1, 0, 0, 0]))
+
+
+def test_vote_batch_is_bounded(authorized_client, dummy_posts):
+    votes = [{"post_id": dummy_posts[0].id, "dir": 1}]
+
+    res = authorized_client.post(
+        "/vote/batch", json=votes * (settings.vote_batch_max_size + 1)
+    )
+
+    assert res.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_vote_batch_post_deleted(authorized_client, dummy_posts, monkeypatch):
+    post_id = dummy_posts[0].id
+    planned = vote_router.plan_votes
+
+    def plan_votes(*args):
+        # as if post 999 had been deleted after the lookup
+        results, to_insert, to_delete = planned(*args)
+        return results, to_insert | {999}, to_delete
+
+    monkeypatch.setattr(vote_router, "plan_votes", plan_votes)
+    res = authorized_client.post("/vote/batch", json=[{"post_id": post_id, "dir": 1}])
+
+    assert res.status_code == status.HTTP_404_NOT_FOUND
+    monkeypatch.undo()
+    assert authorized_client.get(f"/posts/{post_id}").json()["votes"] == 0
+
+
+def test_vote_batch_unauthorized_user(client, dummy_posts):
+    res = client.post("/vote/batch", json=[{"post_id": dummy_posts[0].id, "dir": 1}])
+    assert res.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_vote_is_one_statement(authorized_client, dummy_posts, statements):
+    post_id = dummy_posts[3].id
+    statements.clear()
+
+    res = authorized_client.post("/vote/", json={"post_id": post_id, "dir": 1})
+
+    assert res.status_code == status.HTTP_201_CREATED
+    # the current user, then the vote
+    assert len(statements) == 2
+    assert "ON CONFLICT DO NOTHING" in statements[1]
+
+
+def test_delete_vote_post_not_exist(authorized_client, dummy_posts):
+    res = authorized_client.post("/vote/", json={"post_id": 999, "dir": 0})
+
+    assert res.status_code == status.HTTP_404_NOT_FOUND
+    assert res.json()["detail"] == "Post with 999 does not exist"
+
+
+@pytest.fixture
+def buffer(session, monkeypatch):
+    # an interval long enough that only the tests trigger flushes
+    buffer = VoteBuffer(
+        session_factory=TestingSessionLocal, flush_size=100, flush_seconds=3600
+    )
+    monkeypatch.setattr(settings, "vote_buffer", True)
+    monkeypatch.setattr(vote_router, "vote_buffer", buffer)
+    yield buffer
+    buffer.close()
+
+
+def test_buffered_vote_is_written_on_flush(
+    authorized_client, session, dummy_posts, buffer
+):
+    post_id = dummy_posts[3].id
+
+    res = authorized_client.post("/vote/", json={"post_id": post_id, "dir": 1})
+    assert res.status_code == status.HTTP_202_ACCEPTED
+    assert session.query(models.Vote).count() == 0
+
+    assert buffer.flush() == 1
+    assert session.query(models.Vote).count() == 1
+    assert authorized_client.get(f"/posts/{post_id}").json()["votes"] == 1
+
+
+def test_buffered_votes_keep_last_direction(
+    authorized_client, session, dummy_posts, dummy_vote, buffer
+):
+    voted_id, other_id = dummy_posts[3].id, dummy_posts[2].id
+
+    for post_id, dir in [(voted_id, 0), (other_id, 1), (other_id, 0), (other_id, 1)]:
+        authorized_client.post("/vote/", json={"post_id": post_id, "dir": dir})
+
+    assert buffer.flush() == 2
+    session.expire_all()
+    assert session.get(models.Post, voted_id).votes_count == 0
+    assert session.get(models.Post, other_id).votes_count == 1
+
+
+def test_buffered_vote_post_not_exist(authorized_client, dummy_posts, buffer):
+    res = authorized_client.post("/vote/", json={"post_id": 999, "dir": 1})
+
+    assert res.status_code == status.HTTP_404_NOT_FOUND
+    assert buffer.stats()["pending"] == 0
+
+
+def test_buffered_vote_of_deleted_user_is_skipped(session, dummy_posts, buffer):
+    post_id = dummy_posts[0].id
+    buffer.add(post_id, 999, 1)
+
+    assert buffer.flush() == 1
+    assert buffer.stats()["failures"] == 0
+    assert session.get(models.Post, post_id).votes_count == 0
+
+
+def test_buffered_votes_are_bounded(authorized_client, dummy_posts, buffer):
+    buffer.max_pending = 1
+
+    res = authorized_client.post(
+        "/vote/", json={"post_id": dummy_posts[0].id, "dir": 1}
+    )
+    assert res.status_code == status.HTTP_202_ACCEPTED
+
+    res = authorized_client.post(
+        "/vote/", json={"post_id": dummy_posts[1].id, "dir": 1}
+    )
+    assert res.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def test_get_vote_buffer_stats(client):
+    res = client.get("/vote/buffer")
+
+    assert res.status_code == status.HTTP_200_OK
+    assert {"pending", "flushed", "failures", "dropped"} <= res.json().keys()
+    assert "/vote/buffer" not in client.get("/openapi.json").json()["paths"]
+
+
+def test_failed_flush_keeps_votes(dummy_posts, dummy_user, buffer):
+    def broken_session():
+        raise OperationalError("flush", {}, Exception("server closed the connection"))
+
+    buffer.session_factory = broken_session
+    buffer.add(dummy_posts[0].id, dummy_user["id"], 1)
+
+    with pytest.raises(OperationalError):
+        buffer.flush()
+
+    assert buffer.stats() == {
+        "pending": 1,
+        "flushed": 0,
+        "failures": 1,
+        "dropped": 0,
+    }
+
+    buffer.session_factory = TestingSessionLocal
+    assert buffer.flush() == 1
+
+
+def test_failed_flush_respects_max_pending(dummy_posts, dummy_user, buffer):
+    buffer.max_pending = 2
+    post_ids = [post.id for post in dummy_posts]
+
+    def broken_session():
+        # two votes are accepted while the flush runs
+        buffer.add(post_ids[1], dummy_user["id"], 1)
+        buffer.add(post_ids[2], dummy_user["id"], 1)
+        raise OperationalError("flush", {}, Exception("server closed the connection"))
+
+    buffer.add(post_ids[0], dummy_user["id"], 1)
+    buffer.session_factory = broken_session
+
+    with pytest.raises(OperationalError):
+        buffer.flush()
+
+    assert buffer.stats()["pending"] == 2
+    assert buffer.stats()["dropped"] == 1
+    assert (post_ids[0], dummy_user["id"]) not in buffer.pending
+
+    buffer.session_factory = TestingSessionLocal
+    assert buffer.flush() == 2